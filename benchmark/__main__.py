@@ -0,0 +1,16 @@
+from benchmark.routines.cache_format_benchmark_routine import CacheFormatBenchmark
+from benchmark.routines.etl_access_benchmark_routine import EtlAccessBenchmark
+from benchmark.routines.fee_engine_benchmark_routine import FeeEngineBenchmark
+from benchmark.routines.import_time_benchmark_routine import ImportTimeBenchmark
+from routine.routine_cli import run_routine_from_cli
+
+if __name__ == "__main__":
+    run_routine_from_cli(
+        routines={
+            "fee_engine": FeeEngineBenchmark,
+            "cache_format": CacheFormatBenchmark,
+            "etl_access": EtlAccessBenchmark,
+            "import_time": ImportTimeBenchmark,
+        },
+        default="fee_engine",
+    )
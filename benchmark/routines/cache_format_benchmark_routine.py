@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+
+from benchmark.utils import best_time, make_agency_fees
+from data.data import Data
+from helper.cache import Cache
+from routine.routine import Routine
+
+
+class CacheFormatBenchmark(Routine):
+    """
+    Measures the write and read times of the cache formats on agency tables, and whether the
+    types of the columns survive a round trip
+    """
+
+    @property
+    def name(self):
+        return "cache_format_benchmark"
+
+    def run_routine(self):
+        params = self._config.benchmark
+        cache = Cache(self._config)
+        results = []
+        for table_name, df in self._get_tables().items():
+            for extension in params["cache_format"]["formats"]:
+                path = os.path.join(self._cwd, f"{table_name}.{extension}")
+                write_time = best_time(
+                    lambda: cache.write_file(df, path, extension), params["n_repeats"]
+                )
+                read_time = best_time(
+                    lambda: cache.read_file(path, extension), params["n_repeats"]
+                )
+                read_df = cache.read_file(path, extension)
+
+                results.append(
+                    {
+                        "table": table_name,
+                        "num_rows": df.shape[0],
+                        "format": extension,
+                        "write_s": write_time,
+                        "read_s": read_time,
+                        "size_mb": os.path.getsize(path) / 1e6,
+                        "dtypes_preserved": list(read_df.dtypes) == list(df.dtypes),
+                    }
+                )
+                self._log.info(
+                    f"{table_name} as {extension}: written in {write_time:.3f}s, "
+                    f"read in {read_time:.3f}s"
+                )
+                os.remove(path)
+
+        results = pd.DataFrame(results)
+        path = os.path.join(self._cwd, "cache_format_benchmark.csv")
+        results.to_csv(path, index=False)
+        self._log.info(f"Benchmark results saved to {path}\n{results.to_string()}")
+
+    def _get_tables(self) -> dict:
+        """
+        Cached outputs of the benchmarked ETLs, and a synthetic agency fees table
+        """
+        params = self._config.benchmark["cache_format"]
+        tables = {}
+        if params["etls"]:
+            data = Data(self._config, use_cache=True)
+            for etl_name in params["etls"]:
+                tables[etl_name] = data.get(etl_name)
+        if params["n_agencies"]:
+            tables["synthetic_agency_fees"] = make_agency_fees(
+                params["n_agencies"], seed=self._config.benchmark["seed"]
+            ).astype({"city": "category"})
+        return tables
@@ -0,0 +1,221 @@
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmark.utils import best_time, make_agency_fees
+from data.etl.etl import Etl
+from data.etl.layer1.etl_for_filling_agency_fees import EtlForFillingAgencyFees
+from routine.routine import Routine
+
+
+class EtlAccessBenchmark(Routine):
+    """
+    Measures the time and memory peak of reading the output of an upstream ETL from a downstream
+    ETL, read-only or as a mutable copy, against the two copies made before read-only access.
+    Also measures the processing of `for_filling_agency_fees` from read-only outputs of its
+    upstream ETLs, against copies of them
+    """
+
+    @property
+    def name(self):
+        return "etl_access_benchmark"
+
+    def run_routine(self):
+        params = self._config.benchmark
+        results = []
+        for n_agencies in params["etl_access"]["n_agencies"]:
+            etls = {}
+            etls["synthetic_agency_fees"] = _SyntheticOutput(
+                self._config,
+                etls,
+                "synthetic_agency_fees",
+                make_agency_fees(n_agencies, seed=params["seed"]),
+            )
+            reader = _SyntheticReader(self._config, etls, use_cache=False)
+
+            accesses = {
+                "copy_twice": lambda: reader.get(
+                    "synthetic_agency_fees", mutable=True
+                ).copy(),
+                "mutable": lambda: reader.get("synthetic_agency_fees", mutable=True),
+                "read_only": lambda: reader.get("synthetic_agency_fees"),
+            }
+            for access, get in accesses.items():
+                access_time = best_time(get, params["n_repeats"])
+                read_time = best_time(
+                    lambda: get()[["agency_name", "agency_address"]].drop_duplicates(),
+                    params["n_repeats"],
+                )
+                tracemalloc.start()
+                df = get()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+                results.append(
+                    {
+                        "n_agencies": n_agencies,
+                        "num_rows": df.shape[0],
+                        "access": access,
+                        "access_s": access_time,
+                        "access_and_read_s": read_time,
+                        "peak_mb": peak_mb,
+                    }
+                )
+                self._log.info(
+                    f"{n_agencies} agencies, {access}: {access_time:.4f}s, {peak_mb:.1f} MB"
+                )
+
+        for n_agencies in params["etl_access"]["processing_n_agencies"]:
+            results += self._run_processing(n_agencies)
+
+        results = pd.DataFrame(results)
+        path = os.path.join(self._cwd, "etl_access_benchmark.csv")
+        results.to_csv(path, index=False)
+        self._log.info(f"Benchmark results saved to {path}\n{results.to_string()}")
+
+    def _run_processing(self, n_agencies: int) -> list:
+        """
+        Times `EtlForFillingAgencyFees._process_raw_data` on synthetic outputs of its upstream
+        ETLs, read-only or copied twice as before read-only access
+        """
+        params = self._config.benchmark
+        etls = {}
+        for name, df in _make_upstream_outputs(n_agencies, params["seed"]).items():
+            etls[name] = _SyntheticOutput(self._config, etls, name, df)
+
+        results = []
+        for access, etl_class in [
+            ("processing_copy_twice", _ForFillingCopyingUpstream),
+            ("processing_read_only", _ForFillingWithoutOutput),
+        ]:
+            etl = etl_class(self._config, etls, use_cache=False)
+            process_time = best_time(etl._process_raw_data, params["n_repeats"])
+            tracemalloc.start()
+            df = etl._process_raw_data()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+
+            results.append(
+                {
+                    "n_agencies": n_agencies,
+                    "num_rows": df.shape[0],
+                    "access": access,
+                    "access_and_read_s": process_time,
+                    "peak_mb": peak_mb,
+                }
+            )
+            self._log.info(
+                f"{n_agencies} agencies, {access}: {process_time:.4f}s, {peak_mb:.1f} MB"
+            )
+        return results
+
+
+def _make_upstream_outputs(n_agencies: int, seed: int) -> dict:
+    """
+    Synthetic outputs of `agency_master` and `filled_agency_fees`: half of the agencies have
+    filled fees, and 1% of the agencies are duplicated in the agency master
+    """
+    rng = np.random.RandomState(seed)
+    fees = make_agency_fees(n_agencies, seed=seed)
+    agencies = fees.drop_duplicates("agency_code").reset_index(drop=True)
+    agency_url_pj = "https://www.pagesjaunes.fr/pros/" + agencies["agency_code"]
+    agency_master = pd.DataFrame(
+        {
+            "agency_address": agencies["agency_address"],
+            "postal_code": agencies["postal_code"],
+            "city": agencies["city"],
+            "agency_name": agencies["agency_name"],
+            "telephone": "0100000000",
+            "agency_url": np.where(rng.rand(n_agencies) < 0.3, "", agency_url_pj),
+            "image_url": "",
+            "num_reviews": rng.randint(0, 50, size=n_agencies) * 1.0,
+            "score": rng.uniform(1, 5, n_agencies),
+            "services": "Vente",
+            "network": "Independant",
+            "review_example": "",
+            "agency_url_pj": agency_url_pj,
+            "image_code": agencies["agency_code"],
+        }
+    )
+    duplicated = agency_master.sample(frac=0.01, random_state=seed)
+    agency_master = pd.concat([agency_master, duplicated], ignore_index=True)
+
+    filled = fees[fees["agency_code"].isin(agencies["agency_code"][::2])]
+    filled_agency_fees = pd.DataFrame(
+        {
+            "comment": "",
+            "is_non-standard": False,
+            "is_agency": True,
+            "tarif_dispo-web": True,
+            "agency_name": filled["agency_name"],
+            "agency_address": filled["agency_address"],
+            "postal_code": filled["postal_code"],
+            "city": filled["city"],
+            "price_min": filled["price_min_keuros"],
+            "agency_rate": filled["agency_rate"],
+            "agency_fee_min_keuros": filled["agency_fee_min_keuros"],
+            "agency_url_pj": "https://www.pagesjaunes.fr/pros/" + filled["agency_code"],
+        }
+    ).reset_index(drop=True)
+    return {
+        "agency_master": agency_master,
+        "filled_agency_fees": filled_agency_fees,
+    }
+
+
+class _SyntheticOutput(Etl):
+    """
+    Layer 0 ETL whose output is given, instead of loaded from raw data
+    """
+
+    def __init__(self, config, etls: dict, name: str, df: pd.DataFrame):
+        self._name = name
+        super().__init__(config, etls, use_cache=False)
+        self._processed_data = df
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def layer_id(self):
+        return 0
+
+
+class _SyntheticReader(Etl):
+    """
+    Layer 1 ETL reading `synthetic_agency_fees`
+    """
+
+    @property
+    def name(self):
+        return "synthetic_reader"
+
+    @property
+    def layer_id(self):
+        return 1
+
+    @property
+    def upstream_etls(self):
+        return ["synthetic_agency_fees"]
+
+
+class _ForFillingWithoutOutput(EtlForFillingAgencyFees):
+    """
+    `for_filling_agency_fees`, without writing its files per postal code
+    """
+
+    def _write_partitioned_output(self, df: pd.DataFrame):
+        pass
+
+
+class _ForFillingCopyingUpstream(_ForFillingWithoutOutput):
+    """
+    `for_filling_agency_fees` copying the outputs of its upstream ETLs twice, as before they
+    were shared read-only
+    """
+
+    def get(self, etl_name, mutable: bool = False):
+        return super().get(etl_name, mutable=True).copy()
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmark.utils import best_time, make_agency_fees
+from helper.fee_computation import FeeSchedule, compute_fee
+from routine.routine import Routine
+
+
+class FeeEngineBenchmark(Routine):
+    """
+    Measures the throughput of the fee engine (agencies x prices evaluated per second), against
+    the per-price pandas filtering previously done in `list_agencies`
+    """
+
+    @property
+    def name(self):
+        return "fee_engine_benchmark"
+
+    def run_routine(self):
+        params = self._config.benchmark
+        n_repeats = params["n_repeats"]
+        results = []
+        for n_agencies in params["fee_engine"]["n_agencies"]:
+            agency_fees = make_agency_fees(
+                n_agencies, n_tiers=params["fee_engine"]["n_tiers"], seed=params["seed"]
+            )
+            build_time = best_time(lambda: FeeSchedule(agency_fees), n_repeats)
+            schedule = FeeSchedule(agency_fees)
+
+            for n_prices in params["fee_engine"]["n_prices"]:
+                prices_keuros = np.linspace(50, 1000, n_prices)
+                n_pairs = n_agencies * n_prices
+                engine_time = best_time(
+                    lambda: schedule.evaluate(prices_keuros), n_repeats
+                )
+                if n_pairs <= params["fee_engine"]["max_pairs_baseline"]:
+                    baseline_time = best_time(
+                        lambda: self._pandas_baseline(agency_fees, prices_keuros),
+                        n_repeats,
+                    )
+                else:
+                    baseline_time = np.nan
+
+                results.append(
+                    {
+                        "n_agencies": n_agencies,
+                        "n_tiers": agency_fees.shape[0],
+                        "n_prices": n_prices,
+                        "build_s": build_time,
+                        "engine_s": engine_time,
+                        "engine_pairs_per_s": n_pairs / engine_time,
+                        "baseline_s": baseline_time,
+                        "speedup": baseline_time / engine_time,
+                    }
+                )
+                self._log.info(
+                    f"{n_agencies} agencies x {n_prices} prices: "
+                    f"{n_pairs / engine_time:,.0f} pairs/s "
+                    f"(x{baseline_time / engine_time:.1f} vs pandas)"
+                )
+
+        results = pd.DataFrame(results)
+        path = os.path.join(self._cwd, "fee_engine_benchmark.csv")
+        results.to_csv(path, index=False)
+        self._log.info(f"Benchmark results saved to {path}\n{results.to_string()}")
+
+    @staticmethod
+    def _pandas_baseline(agency_fees: pd.DataFrame, prices_keuros: np.ndarray):
+        """
+        Filtering and fee computation of `list_agencies` before the fee engine, one price at a time
+        """
+        agency_fees = agency_fees.copy()
+        agency_fees["price_max_keuros"] = agency_fees["price_max_keuros"].fillna(1e9)
+        for price_keuros in prices_keuros:
+            relevant = agency_fees[
+                (agency_fees.price_min_keuros <= price_keuros)
+                & (agency_fees.price_max_keuros > price_keuros)
+            ]
+            compute_fee(
+                relevant["agency_rate"], relevant["agency_fee_min_keuros"], price_keuros
+            )
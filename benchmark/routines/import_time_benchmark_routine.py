@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from routine.routine import Routine
+
+# Root of the repository, from which the commands are run
+REPOSITORY_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+class ImportTimeBenchmark(Routine):
+    """
+    Measures the startup latency of CLIs and the import time of routines with
+    `python -X importtime`, and the modules taking the most time to import
+    """
+
+    @property
+    def name(self):
+        return "import_time_benchmark"
+
+    def run_routine(self):
+        params = self._config.benchmark
+        results = []
+        modules = []
+        for command_name, args in params["import_time"]["commands"].items():
+            runs = [self._run(args) for _ in range(params["n_repeats"])]
+            wall_time, imports = min(runs, key=lambda run: run[0])
+            results.append(
+                {
+                    "command": command_name,
+                    "args": " ".join(args),
+                    "wall_s": wall_time,
+                    "import_s": imports["self_us"].sum() / 1e6,
+                    "num_modules": imports.shape[0],
+                }
+            )
+            self._log.info(
+                f"{command_name}: {wall_time:.3f}s, of which "
+                f"{results[-1]['import_s']:.3f}s importing {imports.shape[0]} modules"
+            )
+            # Top-level imports, the time of a module including the modules it imports
+            top_level = imports[imports["depth"] == 0].nlargest(
+                params["import_time"]["n_top_modules"], "cumulative_us"
+            )
+            modules.append(top_level.assign(command=command_name))
+
+        results = pd.DataFrame(results)
+        path = os.path.join(self._cwd, "import_time_benchmark.csv")
+        results.to_csv(path, index=False)
+        modules = pd.concat(modules)[["command", "module", "cumulative_us"]]
+        modules.to_csv(os.path.join(self._cwd, "import_time_modules.csv"), index=False)
+        self._log.info(
+            f"Benchmark results saved to {path}\n{results.to_string()}\n"
+            f"Slowest top-level imports:\n{modules.to_string(index=False)}"
+        )
+
+    @staticmethod
+    def _run(args: list):
+        """
+        Runs Python with `-X importtime`
+
+        Returns
+        -------
+        float
+            Wall-clock time of the command in seconds
+        pd.DataFrame
+            Self and cumulative import time in microseconds and depth of each imported module
+        """
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime"] + list(args),
+            cwd=REPOSITORY_ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        wall_time = time.perf_counter() - start
+
+        # Lines are "import time: <self us> | <cumulative us> | <indented module>"
+        imports = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, module = line[len("import time:") :].split("|")
+            imports.append(
+                {
+                    "module": module.strip(),
+                    "self_us": int(self_us),
+                    "cumulative_us": int(cumulative_us),
+                    "depth": (len(module) - len(module.lstrip()) - 1) // 2,
+                }
+            )
+        return wall_time, pd.DataFrame(imports)
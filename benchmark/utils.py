@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def best_time(func, n_repeats: int = 5):
+    """
+    Times a function
+
+    Parameters
+    ----------
+    func: callable
+        Function to time, called without arguments
+    n_repeats: int, optional, default=5
+        Number of runs
+
+    Returns
+    -------
+    float
+        Best run time in seconds
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def make_agency_fees(
+    n_agencies: int, n_tiers: int = 4, n_postal_codes: int = 100, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Generates a synthetic `agency_fees` table, with the same columns as the one uploaded by the
+    `etl_to_db` routine
+
+    Parameters
+    ----------
+    n_agencies: int
+        Number of agencies
+    n_tiers: int, optional, default=4
+        Maximum number of tiers per agency
+    n_postal_codes: int, optional, default=100
+        Number of postal codes the agencies are spread over
+    seed: int, optional, default=0
+        Random seed
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per agency tier
+    """
+    rng = np.random.RandomState(seed)
+    tiers_per_agency = rng.randint(1, n_tiers + 1, size=n_agencies)
+    agency_ids = np.repeat(np.arange(n_agencies), tiers_per_agency)
+    tier_ranks = np.arange(len(agency_ids)) - np.repeat(
+        np.cumsum(tiers_per_agency) - tiers_per_agency, tiers_per_agency
+    )
+    postal_codes = 75000 + rng.randint(0, n_postal_codes, size=n_agencies)
+
+    price_min = tier_ranks * 100.0 + rng.randint(0, 50, size=len(agency_ids))
+    price_min[tier_ranks == 0] = 0
+    is_last_tier = np.append(agency_ids[1:] != agency_ids[:-1], True)
+    price_max = np.where(is_last_tier, np.nan, np.append(price_min[1:], np.nan))
+    agency_rate = np.where(
+        rng.rand(len(agency_ids)) < 0.2,
+        np.nan,
+        rng.uniform(0.02, 0.08, len(agency_ids)),
+    )
+
+    return pd.DataFrame(
+        {
+            "agency_code": [
+                f"{c}{i:04d}" for c, i in zip(postal_codes[agency_ids], agency_ids)
+            ],
+            "agency_name": [f"agency_{i}" for i in agency_ids],
+            "agency_address": [f"{i} rue de Paris" for i in agency_ids],
+            "postal_code": postal_codes[agency_ids],
+            "city": "Paris",
+            "price_min_keuros": price_min,
+            "price_max_keuros": price_max,
+            "agency_rate": agency_rate,
+            "agency_fee_min_keuros": rng.randint(3, 10, size=len(agency_ids)) * 1.0,
+        }
+    )
@@ -1,8 +1,10 @@
-from data.routines.etl_routine import EtlRoutine
-from data.routines.upload_to_db_routine import EtlUploadDB
 from routine.routine_cli import run_routine_from_cli
 
 if __name__ == "__main__":
     run_routine_from_cli(
-        routines={"etl": EtlRoutine, "etl_to_db": EtlUploadDB}, default="etl"
+        routines={
+            "etl": "data.routines.etl_routine.EtlRoutine",
+            "etl_to_db": "data.routines.upload_to_db_routine.EtlUploadDB",
+        },
+        default="etl",
     )
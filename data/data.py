@@ -1,54 +1,168 @@
+import functools
 import logging
+import os
 
 from config.immo_config import ImmoConfig
+from data.etl.registry import EtlRegistry
+from data.etl.scheduler import run_dag
+from data.etl.state import EtlState
 from helper.cache import Cache
 
-# Layer 0 (raw data import)
-from data.etl.layer0.etl_agency_master import EtlAgencyMaster
-from data.etl.layer0.etl_filled_agency_fees import EtlFilledAgencyFees
-# Layer 1
-from data.etl.layer1.etl_for_filling_agency_fees import EtlForFillingAgencyFees
 
 class Data(object):
     """
     Class to provide a unified interface to retrieve data
     """
 
-    # Lists the ETLs
+    # Lists the ETLs, imported and instantiated on first access
     etls_classes = {
-        # Layer 0
-        "agency_master": EtlAgencyMaster,
-        "filled_agency_fees": EtlFilledAgencyFees,
+        # Layer 0 (raw data import)
+        "agency_master": "data.etl.layer0.etl_agency_master.EtlAgencyMaster",
+        "filled_agency_fees": (
+            "data.etl.layer0.etl_filled_agency_fees.EtlFilledAgencyFees"
+        ),
+        "postal_code_centroids": (
+            "data.etl.layer0.etl_postal_code_centroids.EtlPostalCodeCentroids"
+        ),
         # Layer 1
-        "for_filling_agency_fees": EtlForFillingAgencyFees
+        "for_filling_agency_fees": (
+            "data.etl.layer1.etl_for_filling_agency_fees.EtlForFillingAgencyFees"
+        ),
     }
 
     def __init__(self, config: ImmoConfig, use_cache: bool = True):
         self._log = logging.getLogger(__name__)
         self._config = config
-        self._etls = {}
         self._cache = Cache(config=config)
-        for etl_name, etl_class in self.etls_classes.items():
-            self._etls[etl_name] = self.etls_classes[etl_name](
-                config=self._config,
-                use_cache=use_cache,
-                etls=self._etls,
-                cache=self._cache,
-            )
+        cache_root = (
+            self._cache.prod_cache_root
+            if self._config.cache["cache_to_prod"]
+            else self._cache.local_cache_root
+        )
+        self._state = EtlState(os.path.join(cache_root, "etl_state.json"))
+        self._etls = EtlRegistry(
+            self.etls_classes,
+            config=self._config,
+            use_cache=use_cache,
+            cache=self._cache,
+            state=self._state,
+        )
 
-    def get(self, etl_name: str):
+    def get(
+        self,
+        etl_name: str,
+        mutable: bool = False,
+        columns: list = None,
+        filters: dict = None,
+    ):
+        """
+        Output of an ETL, or a selection of its columns and rows, e.g.
+        `data.get("agency_master", columns=["agency_name"], filters={"postal_code": [75001]})`.
+        See `Etl.get_df`
+        """
         self.check_etl(etl_name)
-        return self._etls[etl_name].df
+        return self._etls[etl_name].get_df(mutable, columns, filters)
 
     def check_etl(self, etl_name: str):
         assert etl_name in self._etls, f"No ETL named {etl_name}"
 
-    def update_etls(self):
-        for etl_name in set(self._etls.keys()).difference(
-            set(self._config.no_update_etls)
-        ):
-            self.update_etl(etl_name)
+    def update_etls(self, max_workers: int = None) -> dict:
+        """
+        Updates all the ETLs but `no_update_etls`. Only the ETLs whose inputs changed since
+        their last update are recomputed, see `plan_update`. ETLs run in threads as soon as their
+        upstream ETLs are updated, so that independent ETLs run concurrently
+
+        Parameters
+        ----------
+        max_workers: int, optional, default=None
+            Number of ETLs updated concurrently. Defaults to `update.max_workers` of the config
+
+        Returns
+        -------
+        dict
+            Timing report, see `run_dag`. The result of each ETL tells whether it was recomputed
+        """
+        if max_workers is None:
+            max_workers = self._config.update["max_workers"]
+        etl_names = self._get_etls_to_update()
+        try:
+            report = run_dag(
+                tasks={
+                    etl_name: functools.partial(self.update_etl, etl_name)
+                    for etl_name in etl_names
+                },
+                dependencies={
+                    etl_name: self._get_upstream_etls(etl_name)
+                    for etl_name in etl_names
+                },
+                max_workers=max_workers,
+            )
+        finally:
+            self._state.save()
+        self._log.info(
+            f"Updated {len(etl_names)} ETLs in {report['wall_s']:.2f}s, critical path "
+            f"{' -> '.join(report['critical_path'])} in {report['critical_path_s']:.2f}s"
+        )
+        return report
+
+    def update_etl(self, etl_name: str) -> bool:
+        """
+        Updates an ETL, unless its inputs did not change since its last run. An ETL which is up
+        to date is not loaded either, ETLs depending on it loading it when they need it
 
-    def update_etl(self, etl_name: str):
+        Returns
+        -------
+        bool
+            Whether the ETL was recomputed
+        """
         self.check_etl(etl_name)
-        self._etls[etl_name]._load_process_cache_raw_data()
+        etl = self._etls[etl_name]
+        recompute = not etl.is_memoized()
+        if recompute:
+            etl._load_process_cache_raw_data()
+        self._state.record(etl_name, etl.fingerprint_inputs)
+        return recompute
+
+    def plan_update(self) -> dict:
+        """
+        ETLs `update_etls` would recompute, and why, without updating anything
+
+        Returns
+        -------
+        dict
+            Changes causing each ETL to be recomputed, by ETL in update order. Empty for the ETLs
+            which are up to date
+        """
+        plan = {}
+        for etl_name in self._get_etls_to_update():
+            etl = self._etls[etl_name]
+            if etl.is_memoized():
+                plan[etl_name] = []
+            elif not self._config.memoization["use"]:
+                plan[etl_name] = ["memoization disabled"]
+            else:
+                plan[etl_name] = self._state.get_changes(
+                    etl_name, etl.fingerprint_inputs
+                ) or ["no cached output"]
+        return plan
+
+    def _get_etls_to_update(self) -> list:
+        return sorted(
+            [
+                etl_name
+                for etl_name in self.etls_classes
+                if etl_name not in self._config.no_update_etls
+            ],
+            key=lambda etl_name: self._etls[etl_name].layer_id,
+        )
+
+    def _get_upstream_etls(self, etl_name: str) -> list:
+        etl = self._etls[etl_name]
+        for upstream_name in etl.upstream_etls:
+            self.check_etl(upstream_name)
+            if self._etls[upstream_name].layer_id >= etl.layer_id:
+                raise AttributeError(
+                    f"ETL {etl_name} can only depend on ETLs with a layer_id strictly smaller "
+                    f"than {etl.layer_id}"
+                )
+        return etl.upstream_etls
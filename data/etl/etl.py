@@ -1,13 +1,21 @@
 import abc
+import hashlib
+import inspect
+import json
 import logging
 import os
+import threading
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 
 from config.immo_config import ImmoConfig
-from helper.cache import Cache
-from helper.utils import get_latest_in_directory
+from data.etl.helper.chunked_reader import read_csv_in_chunks
+from data.etl.helper.partitioned_writer import write_partitions
+from data.etl.state import EtlState
+from helper.cache import Cache, select_rows_columns
+from helper.utils import get_departments, get_latest_in_directory, hash_file
 
 
 class Etl(metaclass=abc.ABCMeta):
@@ -21,6 +29,7 @@ class Etl(metaclass=abc.ABCMeta):
         etls: dict,
         use_cache: bool = True,
         cache: Cache = None,
+        state: EtlState = None,
     ):
         self._log = logging.getLogger(__name__)
         self._config = config
@@ -29,7 +38,12 @@ class Etl(metaclass=abc.ABCMeta):
         self._cache_from_prod = self._config.cache["cache_from_prod"]
         self._etls = etls
         self._processed_data = None
+        self._fingerprint = None
+        self._fingerprint_inputs = None
+        self._state = state
         self._cache = Cache(self._config) if cache is None else cache
+        # ETLs sharing an upstream ETL may load it concurrently
+        self._lock = threading.RLock()
 
         if type(self.layer_id) != int or self.layer_id < 0:
             raise AttributeError("'layer_id' must be a positive integer")
@@ -64,29 +78,158 @@ class Etl(metaclass=abc.ABCMeta):
         pass
 
     @property
-    def df(self) -> pd.DataFrame:
-        if self._processed_data is not None:
-            return self._processed_data.copy()
-        else:
-            # Try to get cache
-            if self._use_cache:
-                self._processed_data = self._cache.get_from_cache(
-                    "etl", self.name, "csv"
+    def upstream_etls(self) -> list:
+        """
+        Names of the ETLs this ETL depends on. Must list every ETL retrieved with `get`, as their
+        fingerprints are part of the fingerprint of this ETL
+        """
+        return []
+
+    @property
+    def fingerprint_inputs(self) -> dict:
+        """
+        Inputs of the ETL: hashes of its raw data file, its config and the source of its classes,
+        and fingerprints of its upstream ETLs
+        """
+        if self._fingerprint_inputs is None:
+            inputs = {}
+            if self.layer_id == 0:
+                read_params = self._config.raw_data[self.name]
+                inputs["config"] = _hash(
+                    json.dumps(read_params, sort_keys=True, default=str)
                 )
-            # If cache not used or not retrieved
+                if self._state is None:
+                    inputs["raw_data"] = hash_file(self._raw_data_path)
+                else:
+                    inputs["raw_data"] = self._state.hash_raw_file(self._raw_data_path)
+            inputs["upstream"] = {
+                etl_name: self._etls[etl_name].fingerprint
+                for etl_name in sorted(self.upstream_etls)
+            }
+            sources = []
+            for etl_class in type(self).__mro__:
+                if issubclass(etl_class, Etl):
+                    try:
+                        sources.append(inspect.getsource(etl_class))
+                    except (OSError, TypeError):
+                        sources.append(etl_class.__qualname__)
+            inputs["code"] = _hash("".join(sources))
+            self._fingerprint_inputs = inputs
+        return self._fingerprint_inputs
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Fingerprint of the output of the ETL: hash of its `fingerprint_inputs`. The output of an
+        ETL is cached along with its fingerprint, so that it is only recomputed when one of its
+        inputs changed
+        """
+        if self._fingerprint is None:
+            self._fingerprint = _hash(
+                json.dumps(self.fingerprint_inputs, sort_keys=True)
+            )
+        return self._fingerprint
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.get_df()
+
+    def get_df(
+        self, mutable: bool = False, columns: list = None, filters: dict = None
+    ) -> pd.DataFrame:
+        """
+        Output of the ETL, loaded from cache or computed on first access
+
+        Parameters
+        ----------
+        mutable: bool, optional, default=False
+            By default, the output is shared with the ETL without copying its data, and is
+            read-only: writing to its values raises an error, but columns can still be added or
+            dropped. Set to True to get a copy which can be modified in place
+        columns: list, optional, default=None
+            Columns to retrieve, all if None
+        filters: dict, optional, default=None
+            Values of the rows to retrieve, as a mapping of columns to lists of values, e.g.
+            {"postal_code": [75001, 75002]}. When the output is not loaded yet, only the selection
+            is read from the cache, without keeping the output in memory
+
+        Returns
+        -------
+        pd.DataFrame
+            Output of the ETL
+        """
+        if columns is not None or filters is not None:
+            return self._get_selection(mutable, columns, filters)
+        with self._lock:
             if self._processed_data is None:
-                self._load_process_cache_raw_data()
-        return self._processed_data.copy()
+                # Try to get cache
+                if self._use_cache:
+                    self._processed_data = self._cache.get_from_cache(
+                        "etl", self.name, self._cache_format
+                    )
+                # If cache not used or not retrieved
+                if self._processed_data is None and not self.load_memoized():
+                    self._load_process_cache_raw_data()
+        if mutable:
+            return self._processed_data.copy()
+        _make_read_only(self._processed_data)
+        return self._processed_data.copy(deep=False)
 
-    def get(self, etl_name):
+    def _get_selection(self, mutable: bool, columns: list, filters: dict):
+        if self._processed_data is None and self._use_cache:
+            df = self._cache.get_from_cache(
+                "etl", self.name, self._cache_format, columns=columns, filters=filters
+            )
+            # Read from disk, so not shared with anything
+            if df is not None:
+                return df
+        df = select_rows_columns(self.get_df(), columns, filters)
+        return df.copy() if mutable else df
+
+    def get(self, etl_name, mutable: bool = False):
+        """
+        Output of an upstream ETL. See `get_df`
+        """
         if etl_name not in self._etls:
             raise KeyError(f"Unknown ETL {etl_name}!")
         elif self._etls[etl_name].layer_id >= self.layer_id:
             raise AttributeError(
                 f"ETL {self.name} can only depend on ETLs with a layer_id strictly smaller than {self.layer_id}"
             )
+        elif etl_name not in self.upstream_etls:
+            raise AttributeError(
+                f"ETL {self.name} must list {etl_name} in its 'upstream_etls'"
+            )
         else:
-            return self._etls[etl_name].df.copy()
+            return self._etls[etl_name].get_df(mutable)
+
+    def is_memoized(self) -> bool:
+        """
+        Whether a cached output matching the fingerprint of the ETL exists, without loading it
+        """
+        return self._config.memoization["use"] and self._cache.exists_in_cache(
+            "etl", self.name, self._cache_format, fingerprint=self.fingerprint
+        )
+
+    def load_memoized(self) -> bool:
+        """
+        Loads the cached output of the ETL matching its fingerprint, if memoization is enabled
+
+        Returns
+        -------
+        bool
+            Whether a cached output with the same fingerprint was found
+        """
+        if not self._config.memoization["use"]:
+            return False
+        df = self._cache.get_from_cache(
+            "etl", self.name, self._cache_format, fingerprint=self.fingerprint
+        )
+        if df is None:
+            return False
+        self._log.info(f"ETL '{self.name}' is up to date, reusing its cached output")
+        self._processed_data = df
+        return True
 
     # ---------------------------------- Private methods ------------------------------------------------------------- #
 
@@ -94,6 +237,11 @@ class Etl(metaclass=abc.ABCMeta):
     def _data_root(self):
         return self._config.general["data_root"]
 
+    @property
+    def _cache_format(self) -> str:
+        etl_formats = self._config.cache["etl_format"]
+        return etl_formats.get(self.name, etl_formats["default"])
+
     def _load_process_cache_raw_data(self):
         if self.layer_id == 0:
             raw_df = self._load_raw_data()
@@ -101,8 +249,57 @@ class Etl(metaclass=abc.ABCMeta):
             raw_df = None
         self._processed_data = self._process_raw_data(raw_df)
 
+        self._save_to_cache(
+            fingerprint=self.fingerprint if self._config.memoization["use"] else None
+        )
+
+    @property
+    def _partition_on(self):
+        """
+        Postal code column the cached output is partitioned on, None if not partitioned
+        """
+        partition_on = self._config.cache["partition_on"]
+        column = partition_on.get(self.name, partition_on["default"])
+        if column is None or column not in self._processed_data.columns:
+            return None
+        return column
+
+    def _save_to_cache(self, fingerprint: str = None):
+        partition_on = self._partition_on
+        if partition_on is not None:
+            # Rows of a department are stored together, see `Cache.write_file`
+            departments = get_departments(self._processed_data[partition_on])
+            if not departments.is_monotonic_increasing:
+                order = np.argsort(departments.values, kind="mergesort")
+                self._processed_data = self._processed_data.take(order)
+        # Written in the background without copying its values, see `Cache.save_to_cache`
+        _make_read_only(self._processed_data)
         self._cache.save_to_cache(
-            df=self._processed_data, module="etl", name=self.name, extension="csv"
+            df=self._processed_data,
+            module="etl",
+            name=self.name,
+            extension=self._cache_format,
+            fingerprint=fingerprint,
+            partition_on=partition_on,
+        )
+
+    def _write_partitioned_output(self, df: pd.DataFrame):
+        """
+        Writes one file of `df` per postal code, if the ETL is listed in
+        `partitioned_outputs` of the config. See `write_partitions`
+        """
+        params = self._config.partitioned_outputs
+        output = params["outputs"].get(self.name)
+        if output is None:
+            return
+        write_partitions(
+            df,
+            "postal_code",
+            root=os.path.join(self._data_root, output["location"]),
+            filename=output["filename"],
+            timestamp=self._config.general["timestamp"],
+            file_format=output["format"],
+            max_workers=params["max_workers"],
         )
 
     def _process_raw_data(self, raw_df: pd.DataFrame = None):
@@ -113,42 +310,48 @@ class Etl(metaclass=abc.ABCMeta):
                 "Method '_process_raw_data' should be implemented for non-raw data ETLs"
             )
 
+    @property
+    def _raw_data_path(self):
+        read_params = self._config.raw_data[self.name]
+        return os.path.join(
+            self._data_root, read_params["location"], read_params["filename"]
+        )
+
     def _load_raw_data(self):
         read_params = self._config.raw_data[self.name]
         self._log.info(
             f"Loading raw data for '{self.name}' from {read_params['location']}"
         )
         if read_params["format"] == "csv":
-            return pd.read_csv(
-                os.path.join(
-                    self._data_root, read_params["location"], read_params["filename"]
-                ),
-                **read_params["read_kwargs"],
-            )
+            if read_params.get("chunksize") is not None:
+                return read_csv_in_chunks(
+                    self._raw_data_path,
+                    read_params["chunksize"],
+                    process_chunk=self._process_raw_chunk,
+                    **read_params["read_kwargs"],
+                )
+            raw_df = pd.read_csv(self._raw_data_path, **read_params["read_kwargs"])
         elif read_params["format"] in ["xls", "xlsx"]:
-            return pd.read_excel(
-                os.path.join(
-                    self._data_root, read_params["location"], read_params["filename"]
-                ),
-                **read_params["read_kwargs"],
-            )
+            raw_df = pd.read_excel(self._raw_data_path, **read_params["read_kwargs"])
         elif read_params["format"] == "parquet":
-            return pd.read_parquet(
-                os.path.join(
-                    self._data_root, read_params["location"], read_params["filename"]
-                ),
-                **read_params["read_kwargs"],
-            )
+            raw_df = pd.read_parquet(self._raw_data_path, **read_params["read_kwargs"])
         else:
             raise NotImplementedError
+        return self._process_raw_chunk(raw_df)
+
+    def _process_raw_chunk(self, raw_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Processing of the raw data done row by row, e.g. renaming or cleaning columns, before
+        `_process_raw_data`. When `chunksize` is set in the `raw_data` config of the ETL, the raw
+        data is read in chunks of rows and each chunk is processed as soon as it is read
+        """
+        return raw_df
 
     def update_cache_after_manual_overlay(self):
-        df = self.df.copy()
+        df = self.get_df(mutable=True)
         df_overlaid = self._apply_manual_overlay(df)
         self._processed_data = df_overlaid
-        self._cache.save_to_cache(
-            df=self._processed_data, module="etl", name=self.name, extension="csv"
-        )
+        self._save_to_cache()
 
     def _apply_manual_overlay(self, df: pd.DataFrame):
         """
@@ -180,3 +383,19 @@ class Etl(metaclass=abc.ABCMeta):
         )
 
         return manual_df
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _make_read_only(df: pd.DataFrame):
+    """
+    Marks the NumPy arrays holding the values of a dataframe as read-only, so that dataframes
+    sharing them cannot modify them in place
+    """
+    # Block manager is `_data` before pandas 1.1
+    manager = df._mgr if hasattr(df, "_mgr") else df._data
+    for block in manager.blocks:
+        if isinstance(block.values, np.ndarray):
+            block.values.flags.writeable = False
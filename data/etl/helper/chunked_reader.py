@@ -0,0 +1,83 @@
+import logging
+from typing import Callable
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+log = logging.getLogger(__name__)
+
+
+def read_csv_in_chunks(
+    path: str,
+    chunksize: int,
+    process_chunk: Callable[[pd.DataFrame], pd.DataFrame] = None,
+    **read_kwargs,
+) -> pd.DataFrame:
+    """
+    Reads a CSV file `chunksize` rows at a time, processing each chunk as soon as it is read, so
+    that only one chunk of raw rows is in memory at once. Processed chunks are kept until they
+    are concatenated, which copies them: peak memory is about twice the processed result,
+    whatever the size of the raw file. Dtypes should be given in `read_kwargs`, as dtypes
+    inferred from different chunks may differ
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+    chunksize: int
+        Number of rows read at once
+    process_chunk: Callable, optional, default=None
+        Processing of a chunk, e.g. renaming or cleaning its columns
+    read_kwargs:
+        Arguments of `pd.read_csv`
+
+    Returns
+    -------
+    pd.DataFrame
+        Processed chunks, see `concat_chunks`
+    """
+    chunks = []
+    num_rows = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, **read_kwargs):
+        num_rows += chunk.shape[0]
+        if process_chunk is not None:
+            chunk = process_chunk(chunk)
+        chunks.append(chunk)
+    if len(chunks) == 0:
+        # No rows, the columns are read from the header
+        chunk = pd.read_csv(path, nrows=0, **read_kwargs)
+        chunks.append(chunk if process_chunk is None else process_chunk(chunk))
+    log.info(f"Read {num_rows} rows of {path} in {len(chunks)} chunks")
+    return concat_chunks(chunks)
+
+
+def concat_chunks(chunks: list) -> pd.DataFrame:
+    """
+    Concatenates dataframes with the same columns. Categorical columns stay categorical, with the
+    union of the categories of the chunks, where `pd.concat` would turn them into object columns
+    when the chunks have different categories. The result is a copy, allocated while the chunks
+    are still in memory
+
+    Parameters
+    ----------
+    chunks: list
+        Dataframes to concatenate
+
+    Returns
+    -------
+    pd.DataFrame
+        Concatenated dataframes, with a new index
+    """
+    categorical_columns = [
+        column
+        for column, dtype in chunks[0].dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    for column in categorical_columns:
+        categories = union_categoricals(
+            [chunk[column] for chunk in chunks], ignore_order=True
+        ).categories
+        # Only the codes of the chunks are remapped
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from helper.file_io import file_lock
+
+log = logging.getLogger(__name__)
+
+# Hashes of the partitions last written under a root, by partition
+MANIFEST_FILENAME = "partitions.json"
+
+
+def write_partitions(
+    df: pd.DataFrame,
+    partition_column: str,
+    root: str,
+    filename: str,
+    timestamp: str,
+    file_format: str = "csv",
+    max_workers: int = 1,
+) -> dict:
+    """
+    Writes one file per value of a column, e.g. per postal code, under
+    `<root>/<value>/<timestamp>_<filename>_<value>.<file_format>`.
+    Rows are split in a single pass, and files are written in parallel by a pool of processes.
+    Partitions whose content did not change since they were last written under `root` are
+    skipped
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Rows to write, without their index
+    partition_column: str
+        Column to partition the rows on
+    root: str
+        Directory of the partitions
+    filename: str
+        Name of the files, before the value of the partition
+    timestamp: str
+        Timestamp prefixing the names of the files
+    file_format: str, optional, default="csv"
+        "csv", "xlsx" or "parquet"
+    max_workers: int, optional, default=1
+        Number of processes writing partitions. 1 to write them in the current process
+
+    Returns
+    -------
+    dict
+        Number of partitions written and skipped
+    """
+    if file_format not in ["csv", "xlsx", "parquet"]:
+        raise NotImplementedError(f"Cannot write partitions as {file_format}")
+    os.makedirs(root, exist_ok=True)
+    manifest_path = os.path.join(root, MANIFEST_FILENAME)
+
+    # Partition of each row, and hash of each row, in one pass over the dataframe
+    positions = df.groupby(partition_column, sort=False).indices
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    header = json.dumps([str(c) for c in df.columns] + [file_format]).encode()
+
+    with file_lock(manifest_path + ".lock"):
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+        to_write = {}
+        for value, value_positions in positions.items():
+            key = str(value)
+            content_hash = hashlib.sha256(
+                header + row_hashes[value_positions].tobytes()
+            ).hexdigest()
+            previous = manifest.get(key)
+            if (
+                previous is not None
+                and previous["hash"] == content_hash
+                and os.path.exists(os.path.join(root, key, previous["filename"]))
+            ):
+                continue
+            to_write[key] = (
+                value_positions,
+                content_hash,
+                f"{timestamp}_{filename}_{key}.{file_format}",
+            )
+
+        tasks = [
+            (df.take(value_positions), os.path.join(root, key, name), file_format)
+            for key, (value_positions, _, name) in to_write.items()
+        ]
+        if max_workers > 1 and len(tasks) > 1:
+            # Spawned, as forking a process running threads may deadlock
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                # Partitions are sent to the processes in batches
+                chunksize = max(1, len(tasks) // (4 * max_workers))
+                list(executor.map(_write_partition, *zip(*tasks), chunksize=chunksize))
+        else:
+            for task in tasks:
+                _write_partition(*task)
+
+        for key, (_, content_hash, name) in to_write.items():
+            manifest[key] = {"hash": content_hash, "filename": name}
+        tmp_path = f"{manifest_path}.tmp_{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    counts = {"written": len(to_write), "skipped": len(positions) - len(to_write)}
+    log.info(
+        f"Wrote {counts['written']} partitions to {root}, skipped {counts['skipped']} "
+        "unchanged ones"
+    )
+    return counts
+
+
+def _write_partition(df: pd.DataFrame, path: str, file_format: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under another name, then renamed, so that no partial file is left behind
+    tmp_path = os.path.join(
+        os.path.dirname(path), f".tmp_{os.getpid()}_{os.path.basename(path)}"
+    )
+    if file_format == "csv":
+        df.to_csv(tmp_path, index=False)
+    elif file_format == "xlsx":
+        df.to_excel(tmp_path, index=False)
+    else:
+        df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
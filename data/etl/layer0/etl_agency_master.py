@@ -1,5 +1,4 @@
 import pandas as pd
-import os
 
 from data.etl.etl import Etl
 
@@ -17,9 +16,8 @@ class EtlAgencyMaster(Etl):
     def layer_id(self):
         return 0
 
-    def _process_raw_data(self, raw_df: pd.DataFrame = None):
-        df = raw_df
-        df = df.rename(
+    def _process_raw_chunk(self, raw_df: pd.DataFrame) -> pd.DataFrame:
+        return raw_df.rename(
             columns={
                 "adresse": "agency_address",
                 "Code Postal": "postal_code",
@@ -37,40 +35,10 @@ class EtlAgencyMaster(Etl):
             }
         )
 
-        list_postal_code = df.postal_code.unique()
-        for c in list_postal_code:
-            # Make folder to save outputs if not existed
-            if not os.path.exists(
-                os.path.join(
-                    "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                    "02_agency_fees",
-                    "agency_master",
-                    str(c),
-                )
-            ):
-                os.makedirs(
-                    os.path.join(
-                        "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                        "02_agency_fees",
-                        "agency_master",
-                        str(c),
-                    )
-                )
-
-            df_postal_code = df[df.postal_code == c]
-            df_postal_code.to_csv(
-                os.path.join(
-                    "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                    "02_agency_fees",
-                    "agency_master",
-                    str(c),
-                    self._config.general["timestamp"]
-                    + "_"
-                    + "agency_master_"
-                    + str(c)
-                    + ".csv",
-                ),
-                index=False,
-            )
-
-        return df
+    def _process_raw_data(self, raw_df: pd.DataFrame = None):
+        # Read as floats, see the config. Not nullable integers, which pyarrow < 0.15 cannot
+        # write to the cache
+        if not raw_df["postal_code"].isna().any():
+            raw_df["postal_code"] = raw_df["postal_code"].astype("int64")
+        self._write_partitioned_output(raw_df)
+        return raw_df
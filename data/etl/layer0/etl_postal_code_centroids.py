@@ -0,0 +1,52 @@
+import pandas as pd
+
+from data.etl.etl import Etl
+from helper.postal_code_index import PostalCodeNeighbourIndex
+
+
+class EtlPostalCodeCentroids(Etl):
+    """
+    ETL to load the centroids of postal codes, and build the index of neighbouring postal codes
+    """
+
+    @property
+    def name(self):
+        return "postal_code_centroids"
+
+    @property
+    def layer_id(self):
+        return 0
+
+    @property
+    def neighbour_index(self) -> PostalCodeNeighbourIndex:
+        index = self._cache.get_from_cache("index", self.name, "dill")
+        if index is None:
+            index = self._build_neighbour_index(self.df)
+        return index
+
+    def _load_process_cache_raw_data(self):
+        super()._load_process_cache_raw_data()
+        self._build_neighbour_index(self._processed_data)
+
+    def _process_raw_data(self, raw_df: pd.DataFrame = None):
+        df = raw_df.rename(
+            columns={"Code_postal": "postal_code", "coordonnees_gps": "coordinates"}
+        )
+        df = df[~df.coordinates.isna()]
+        coordinates = df["coordinates"].str.split(",", expand=True).astype(float)
+        df = df.assign(latitude=coordinates[0], longitude=coordinates[1])
+
+        # A postal code may cover several communes
+        df = (
+            df.groupby("postal_code")[["latitude", "longitude"]].mean().reset_index()
+        )
+        self._log.info(f"Loaded centroids of {df.shape[0]} postal codes.")
+
+        return df
+
+    def _build_neighbour_index(self, df: pd.DataFrame):
+        index = PostalCodeNeighbourIndex(df)
+        self._cache.save_to_cache(
+            module="index", name=self.name, extension="dill", predictor=index
+        )
+        return index
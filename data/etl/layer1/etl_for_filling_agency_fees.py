@@ -1,5 +1,4 @@
 import pandas as pd
-import os
 from data.etl.etl import Etl
 import numpy as np
 
@@ -17,6 +16,10 @@ class EtlForFillingAgencyFees(Etl):
     def layer_id(self):
         return 1
 
+    @property
+    def upstream_etls(self):
+        return ["agency_master", "filled_agency_fees"]
+
     def _process_raw_data(self, raw_df: pd.DataFrame = None):
         agencies = self.get("agency_master")
         num_agencies_duplicated = (
@@ -27,6 +30,8 @@ class EtlForFillingAgencyFees(Etl):
             self._log.warning(
                 f"There are {num_agencies_duplicated} duplicated agencies in agency master."
             )
+            # Outputs of upstream ETLs are read-only
+            agencies = agencies.copy()
             agencies.loc[
                 (agencies.agency_url == "")
                 | (agencies.agency_url == "Rejoignez nous sur Facebook"),
@@ -141,38 +146,6 @@ class EtlForFillingAgencyFees(Etl):
             ]
         ]
 
-
-        list_postal_code = df.postal_code.unique()
-        for c in list_postal_code:
-            # Make folder to save outputs if not existed
-            if not os.path.exists(
-                os.path.join(
-                    "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                    "02_agency_fees",
-                    "for_filling",
-                    str(c),
-                )
-            ):
-                os.makedirs(
-                    os.path.join(
-                        "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                        "02_agency_fees",
-                        "for_filling",
-                        str(c),
-                    )
-                )
-
-            df_postal_code = df[df.postal_code == c]
-            df_postal_code.to_excel(
-                os.path.join(
-                    "/Users/jacquemart rata/Documents/04_PERSO/Immo/00_data",
-                    "02_agency_fees",
-                    "for_filling",
-                    str(c),
-                    self._config.general["timestamp"] + "_"
-                    "for_filling_agencie_fees_" + str(c) + ".xlsx",
-                ),
-                index=False,
-            )
+        self._write_partitioned_output(df)
 
         return df
@@ -0,0 +1,52 @@
+import threading
+from collections.abc import Mapping
+
+from helper.utils import import_object
+
+
+class EtlRegistry(Mapping):
+    """
+    ETLs by name. Each ETL is imported and instantiated on first access, so that getting one ETL
+    does not import the modules and dependencies of the others
+    """
+
+    def __init__(self, etl_classes: dict, **etl_kwargs):
+        """
+        Parameters
+        ----------
+        etl_classes: dict
+            Classes of the ETLs, or dotted paths of the classes, by name
+        etl_kwargs:
+            Arguments of the ETLs but `etls`, which is the registry itself
+        """
+        self._etl_classes = etl_classes
+        self._etl_kwargs = etl_kwargs
+        self._etls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def instantiated(self) -> list:
+        """
+        Names of the ETLs instantiated so far
+        """
+        return list(self._etls)
+
+    def __getitem__(self, etl_name: str):
+        if etl_name not in self._etls:
+            with self._lock:
+                if etl_name not in self._etls:
+                    etl_class = self._etl_classes[etl_name]
+                    if isinstance(etl_class, str):
+                        etl_class = import_object(etl_class)
+                    self._etls[etl_name] = etl_class(etls=self, **self._etl_kwargs)
+        return self._etls[etl_name]
+
+    def __contains__(self, etl_name) -> bool:
+        # Without instantiating the ETL
+        return etl_name in self._etl_classes
+
+    def __iter__(self):
+        return iter(self._etl_classes)
+
+    def __len__(self) -> int:
+        return len(self._etl_classes)
@@ -0,0 +1,97 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+
+def run_dag(tasks: dict, dependencies: dict, max_workers: int = 1) -> dict:
+    """
+    Runs tasks in threads, each task starting as soon as the tasks it depends on are done.
+    Tasks ready at the same time start in the order of `tasks`. When a task fails, no other task
+    is started, and the error is raised once the running tasks are done
+
+    Parameters
+    ----------
+    tasks: dict
+        Functions without arguments to run, by name
+    dependencies: dict
+        Names of the tasks each task depends on. Dependencies which are not in `tasks` are
+        ignored
+    max_workers: int, optional, default=1
+        Number of tasks run concurrently
+
+    Returns
+    -------
+    dict
+        Timing report: wall-clock time, critical path (longest chain of dependent tasks) and its
+        duration, and start, end and duration of each task, in seconds since the start. The
+        results of the tasks are under "result"
+    """
+    dependencies = {
+        name: [d for d in dependencies.get(name, []) if d in tasks] for name in tasks
+    }
+    remaining = {name: set(upstream) for name, upstream in dependencies.items()}
+    nodes = {}
+    running = {}
+    error = None
+    start_time = time.perf_counter()
+
+    def run_task(name):
+        nodes[name] = {"start_s": time.perf_counter() - start_time}
+        result = tasks[name]()
+        nodes[name]["end_s"] = time.perf_counter() - start_time
+        return result
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="dag"
+    ) as executor:
+        while True:
+            if error is None:
+                for name in [n for n in tasks if n in remaining and not remaining[n]]:
+                    del remaining[name]
+                    running[executor.submit(run_task, name)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    log.error(f"'{name}' failed: {future.exception()!r}")
+                    error = error or future.exception()
+                    continue
+                nodes[name]["result"] = future.result()
+                for upstream in remaining.values():
+                    upstream.discard(name)
+    if error is not None:
+        raise error
+    if remaining:
+        raise ValueError(f"Cycle in the dependencies of {sorted(remaining)}")
+
+    for name, node in nodes.items():
+        node["duration_s"] = node["end_s"] - node["start_s"]
+        node["upstream"] = dependencies[name]
+    critical_path = _critical_path(nodes, dependencies)
+    return {
+        "wall_s": time.perf_counter() - start_time,
+        "critical_path": critical_path,
+        "critical_path_s": sum(nodes[name]["duration_s"] for name in critical_path),
+        "max_workers": max_workers,
+        "tasks": nodes,
+    }
+
+
+def _critical_path(nodes: dict, dependencies: dict) -> list:
+    # Longest chain of dependent tasks, each task ending after the tasks it depends on
+    longest = {}
+    for name in sorted(nodes, key=lambda n: nodes[n]["end_s"]):
+        previous = max(dependencies[name], key=lambda d: longest[d][0], default=None)
+        duration = nodes[name]["duration_s"]
+        if previous is None:
+            longest[name] = (duration, [name])
+        else:
+            longest[name] = (
+                longest[previous][0] + duration,
+                longest[previous][1] + [name],
+            )
+    return max(longest.values(), default=(0, []))[1]
@@ -0,0 +1,124 @@
+import copy
+import json
+import logging
+import os
+import threading
+
+from helper.file_io import file_lock
+from helper.utils import hash_file
+
+
+class EtlState(object):
+    """
+    State of the last update of the ETLs, kept in a JSON file next to their cache: the inputs each
+    ETL was computed from, and the modification time, size and hash of the raw data files. Raw
+    data files are only hashed again when their modification time or size changed
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path: str
+            Path of the JSON file, created on first `save`
+        """
+        self._log = logging.getLogger(__name__)
+        self._path = path
+        self._lock = threading.Lock()
+        self._state = {"raw_files": {}, "etls": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._state.update(json.load(f))
+
+    def hash_raw_file(self, path: str) -> str:
+        """
+        Hash of a raw data file, reused from the state while the file is not modified
+
+        Parameters
+        ----------
+        path: str
+            Path of the file
+
+        Returns
+        -------
+        str
+            Hash of the file
+        """
+        stat = os.stat(path)
+        with self._lock:
+            known = self._state["raw_files"].get(path)
+        if (
+            known is not None
+            and known["mtime"] == stat.st_mtime
+            and known["size"] == stat.st_size
+        ):
+            return known["hash"]
+
+        self._log.info(f"Hashing {path}")
+        file_hash = hash_file(path)
+        with self._lock:
+            self._state["raw_files"][path] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "hash": file_hash,
+            }
+        return file_hash
+
+    def get_changes(self, etl_name: str, inputs: dict) -> list:
+        """
+        Inputs of an ETL which changed since its last update
+
+        Parameters
+        ----------
+        etl_name: str
+            Name of the ETL
+        inputs: dict
+            Current inputs of the ETL, see `Etl.fingerprint_inputs`
+
+        Returns
+        -------
+        list
+            Descriptions of the changed inputs, ["never updated"] if the ETL has no state
+        """
+        with self._lock:
+            previous = self._state["etls"].get(etl_name)
+        if previous is None:
+            return ["never updated"]
+
+        changes = [
+            f"{name} changed"
+            for name in ["raw_data", "config", "code"]
+            if inputs.get(name) != previous.get(name)
+        ]
+        upstream, previous_upstream = inputs["upstream"], previous.get("upstream", {})
+        changes += [
+            f"upstream ETL {name} changed"
+            for name in sorted(set(upstream).union(previous_upstream))
+            if upstream.get(name) != previous_upstream.get(name)
+        ]
+        return changes
+
+    def record(self, etl_name: str, inputs: dict):
+        """
+        Records the inputs an ETL was updated from
+        """
+        with self._lock:
+            self._state["etls"][etl_name] = copy.deepcopy(inputs)
+
+    def save(self):
+        """
+        Saves the state, merged with the state saved concurrently by other processes
+        """
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with file_lock(self._path + ".lock"):
+            state = {"raw_files": {}, "etls": {}}
+            if os.path.exists(self._path):
+                with open(self._path) as f:
+                    state.update(json.load(f))
+            with self._lock:
+                for key in ["raw_files", "etls"]:
+                    state[key].update(self._state[key])
+            tmp_path = f"{self._path}.tmp_{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
@@ -1,5 +1,9 @@
+import json
+import os
+
 from routine.routine import Routine
 from data.data import Data
+from helper.utils import json_serial
 
 
 class EtlRoutine(Routine):
@@ -13,4 +17,19 @@ class EtlRoutine(Routine):
 
     def run_routine(self):
         data = Data(self._config, use_cache=False)
-        data.update_etls()
+        if self._config.general["dry_run"]:
+            for etl_name, changes in data.plan_update().items():
+                print(
+                    f"{etl_name}: rebuild ({', '.join(changes)})"
+                    if changes
+                    else f"{etl_name}: up to date"
+                )
+            return
+
+        report = data.update_etls()
+        json.dump(
+            report,
+            open(os.path.join(self._cwd, "etl_timings.json"), "w"),
+            default=json_serial,
+            indent=2,
+        )
@@ -1,16 +1,35 @@
+import copy
+import io
+import json
 import logging
 from pathlib import Path
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 import warnings
-from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from config.immo_config import ImmoConfig
-from helper.utils import get_latest_in_directory
-from helper.file_io import save_pickle, load_pickle
+from helper.utils import get_departments, get_latest_in_directory, hash_file
+from helper.file_io import (
+    LazyArtifact,
+    file_lock,
+    loads_pickle,
+    read_buffer,
+    save_pickle,
+)
 
 warnings.simplefilter(action="ignore", category=Warning)
 
+# Index of the cached versions of all the objects of a cache root
+MANIFEST_FILENAME = "manifest.json"
+# Advisory locks: one per cache root for the manifest, one per cached object
+MANIFEST_LOCK_FILENAME = ".manifest.lock"
+LOCK_FILENAME = ".lock"
+
 
 class Cache(object):
     """
@@ -27,6 +46,20 @@ class Cache(object):
             Cache.__instance = object.__new__(cls)
         return Cache.__instance
 
+    @classmethod
+    def reset_instance(cls):
+        """
+        Discards the cache instance once its background writes are done, so that the next
+        `Cache(config)` creates a new one, e.g. with another config in tests
+        """
+        instance = Cache.__instance
+        if instance is not None and Cache.__initialized:
+            instance.flush(raise_errors=False)
+            if instance._writer is not None:
+                instance._writer.shutdown()
+        Cache.__instance = None
+        Cache.__initialized = False
+
     def __init__(self, config: ImmoConfig):
         # Initialize it only once
         if not Cache.__initialized:
@@ -37,7 +70,29 @@ class Cache(object):
             self._from_prod = self._config.cache["cache_from_prod"]
             self._read_kwargs = self._config.cache["read_kwargs"]
             self._write_kwargs = self._config.cache["write_kwargs"]
-            self._cache_dict = defaultdict(dict)
+            self._retention = self._config.cache["retention"]
+            self._manifests = {}
+            max_memory_mb = self._config.cache["max_memory_mb"]
+            self._memory = MemoryTier(
+                None if max_memory_mb is None else max_memory_mb * 1e6
+            )
+            self._async_writes = self._config.cache["async_writes"]
+            self._writer = None
+            # Background writes not yet waited for, by `module/name`: futures in submission
+            # order, mapped to the extension and fingerprint of the version they write
+            self._pending_writes = {}
+            self._pending_writes_lock = threading.Lock()
+            self._stats = CacheStats()
+            # Reads of files in progress, by object and version
+            self._reads = {}
+            self._reads_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Returns the cache instance, None if it has not been created yet
+        """
+        return Cache.__instance
 
     @property
     def prod_cache_root(self):
@@ -52,35 +107,338 @@ class Cache(object):
             Path.home(), self._config.cache["root_local_relative_to_home"]
         )
 
-    def get_from_cache(self, module: str, name: str, extension: str):
-        df = self.get_from_cache_dict(module, name)
-        if df is not None:
-            return df
+    def get_from_cache(
+        self,
+        module: str,
+        name: str,
+        extension: str,
+        fingerprint: str = None,
+        columns: list = None,
+        filters: dict = None,
+        lazy: bool = False,
+    ):
+        """
+        Retrieves the latest cached version of `module` / `name`, or a selection of its columns
+        and rows
+        Thread-safe: concurrent calls for the same object wait for a single read of its file,
+        while reads of different objects run in parallel
+
+        Parameters
+        ----------
+        module: str
+            Module of the cached object, e.g. "etl"
+        name: str
+            Name of the cached object
+        extension: str
+            Format of the cached object
+        fingerprint: str, optional, default=None
+            When given, only the version saved with this fingerprint is retrieved
+        columns: list, optional, default=None
+            Columns of the dataframe to retrieve, all if None
+        filters: dict, optional, default=None
+            Values of the rows to retrieve, as a mapping of columns to lists of values. Only the
+            row groups of parquet files which can hold these values are read
+        lazy: bool, optional, default=False
+            Return a `LazyArtifact` proxy, which only reads the object on first use. The latest
+            version is then resolved at first use
+
+        Returns
+        -------
+        pd.DataFrame or object
+            Cached object, None if not found
+        """
+        key = self._manifest_key(module, name)
+        selection = columns is not None or filters is not None
+        if fingerprint is None:
+            df = self.get_from_cache_dict(module, name)
+            if df is not None:
+                self._stats.record_hit(key, "memory")
+                return select_rows_columns(df, columns, filters) if selection else df
+
+        start_time = time.perf_counter()
+        # A version being written in the background is read once written
+        self._wait_for_write(key)
+        for mode in ["prod"] if self._from_prod else ["local", "prod"]:
+            if self._get_latest_entry(module, name, mode, extension, fingerprint):
+                break
         else:
-            if self.has_cache(module, name, "local") and not self._from_prod:
-                self._log.info(f"Retrieving local cache for {module} {name}")
-                path = self.make_cache_path(module, name, "local")
-                df = self.get_cache_from_path(path, name, extension)
-                self._cache_dict[module][name] = df
-                return df
-            elif self.has_cache(module, name, "prod"):
-                self._log.info(f"Retrieving prod cache for {module} {name}")
-                path = self.make_cache_path(module, name, "prod")
-                df = self.get_cache_from_path(path, name, extension)
-                self._cache_dict[module][name] = df
-                return df
-            else:
-                return None
+            self._stats.record_miss(key)
+            return None
+        if lazy:
+            return LazyArtifact(
+                lambda: self.get_from_cache(
+                    module, name, extension, fingerprint, columns, filters
+                )
+            )
+
+        if selection:
+            return self._read_version(
+                module, name, extension, fingerprint, mode, start_time, columns, filters
+            )
+
+        # Concurrent reads of the same object wait for a single read of its file
+        read_key = (module, name, extension, fingerprint)
+        with self._reads_lock:
+            read = self._reads.get(read_key)
+            is_reader = read is None
+            if is_reader:
+                read = Future()
+                self._reads[read_key] = read
+        if not is_reader:
+            self._stats.record_shared_read(key)
+            return read.result()
+        try:
+            df = self._read_version(
+                module, name, extension, fingerprint, mode, start_time
+            )
+            read.set_result(df)
+        except BaseException as e:
+            read.set_exception(e)
+            raise
+        finally:
+            with self._reads_lock:
+                del self._reads[read_key]
+        return df
+
+    def exists_in_cache(
+        self, module: str, name: str, extension: str = None, fingerprint: str = None
+    ) -> bool:
+        """
+        Whether a version of `module` / `name` is cached, without reading it. Versions being
+        written in the background count as cached
+
+        Parameters
+        ----------
+        module: str
+            Module of the cached object, e.g. "etl"
+        name: str
+            Name of the cached object
+        extension: str, optional, default=None
+            Format of the cached object, any if None
+        fingerprint: str, optional, default=None
+            When given, only a version saved with this fingerprint counts
+
+        Returns
+        -------
+        bool
+            Whether the object is cached
+        """
+        key = self._manifest_key(module, name)
+        with self._pending_writes_lock:
+            pending = list(self._pending_writes.get(key, {}).values())
+        for pending_extension, pending_fingerprint in pending:
+            if (extension is None or pending_extension == extension) and (
+                fingerprint is None or pending_fingerprint == fingerprint
+            ):
+                return True
+        return any(
+            self._get_latest_entry(module, name, mode, extension, fingerprint)
+            for mode in (["prod"] if self._from_prod else ["local", "prod"])
+        )
 
     def get_from_cache_dict(self, module, name):
-        if module in self._cache_dict:
-            if name in self._cache_dict[module]:
-                return self._cache_dict[module][name]
-        return None
+        return self._memory.get((module, name))
+
+    def _read_version(
+        self,
+        module: str,
+        name: str,
+        extension: str,
+        fingerprint: str,
+        mode: str,
+        start_time: float,
+        columns: list = None,
+        filters: dict = None,
+    ):
+        key = self._manifest_key(module, name)
+        self._log.info(f"Retrieving {mode} cache for {module} {name}")
+        cache_dir = self.make_cache_path(module, name, mode)
+        # Versions are not deleted while they are being read. The latest one is resolved again
+        # once locked, as it may have been replaced in the meantime
+        with file_lock(os.path.join(cache_dir, LOCK_FILENAME), shared=True):
+            entry = self._get_latest_entry(module, name, mode, extension, fingerprint)
+            if entry is None:
+                self._stats.record_miss(key)
+                return None
+            self._log.info(f"Using latest cached {entry['filename']}")
+            content = self._read_content(
+                os.path.join(cache_dir, entry["filename"]), extension, columns, filters
+            )
+        # Parsed once unlocked: the content read stays readable if the version is deleted, even
+        # when memory-mapped
+        read_time = time.perf_counter()
+        df = self._parse_content(content, extension, columns, filters)
+        self._stats.record_hit(key, mode)
+        self._stats.record_read(
+            key,
+            entry["size_bytes"],
+            read_time - start_time,
+            time.perf_counter() - read_time,
+        )
+        # Selections are not kept in memory, as they cannot serve other reads
+        if fingerprint is None and columns is None and filters is None:
+            # Objects other than dataframes are measured by the size of their file
+            if isinstance(df, pd.DataFrame):
+                num_bytes = int(df.memory_usage(deep=True).sum())
+            else:
+                num_bytes = entry["size_bytes"]
+            self._memory.put((module, name), df, num_bytes)
+        return df
+
+    def stats(self) -> dict:
+        """
+        Statistics of the cache since the start of the process, per `module/name` and in total:
+        hits by tier ("memory", "local", "prod"), misses, reads served by the concurrent read of
+        another thread, bytes read and written, and time spent reading, parsing and writing.
+        Reading time runs from the call to `get_from_cache`, including waits for writes and
+        locks, to the file being read: the Arrow table for parquet and feather, the bytes of
+        the file otherwise. Parsing time is the conversion of the file read to the object
+
+        Returns
+        -------
+        dict
+            JSON-serializable statistics
+        """
+        return self._stats.to_dict()
+
+    def save_stats(self, path):
+        """
+        Saves `stats` as JSON
+
+        Parameters
+        ----------
+        path: str
+            Path of the JSON file
+        """
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+        self._log.info(f"Cache statistics saved to {path}")
 
     def save_to_cache(
-        self, module: str, name: str, extension: str, df=pd.DataFrame(), predictor=None
+        self,
+        module: str,
+        name: str,
+        extension: str,
+        df=pd.DataFrame(),
+        predictor=None,
+        fingerprint: str = None,
+        partition_on: str = None,
     ):
+        """
+        Saves a new version of `module` / `name`. With `async_writes`, dataframes are written in
+        a background thread: errors are raised by the next call, by reads of the same object, or
+        by `flush`. Columns can be added to or dropped from the dataframe meanwhile, but its
+        values are not copied and must not be modified in place, ETL outputs being read-only
+
+        Parameters
+        ----------
+        module: str
+            Module of the cached object, e.g. "etl"
+        name: str
+            Name of the cached object
+        extension: str
+            Format of the cached object
+        df: pd.DataFrame, optional
+            Dataframe to cache
+        predictor: object, optional
+            Object to cache with the "dill" extension
+        fingerprint: str, optional, default=None
+            Fingerprint of the inputs the object was computed from
+        partition_on: str, optional, default=None
+            Postal code column of the dataframe. See `write_file`
+        """
+        self._raise_failed_writes()
+        key = self._manifest_key(module, name)
+        self._memory.discard((module, name))
+        timestamp = self._config.general["timestamp"]
+        # Objects other than dataframes are written synchronously
+        if extension == "dill":
+            self._wait_for_write(key)
+            self._write_version(
+                module, name, extension, predictor, fingerprint, timestamp
+            )
+            return
+        if not self._async_writes:
+            self._wait_for_write(key)
+            self._write_version(
+                module, name, extension, df, fingerprint, timestamp, partition_on
+            )
+            return
+
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="cache_writer"
+            )
+        future = self._writer.submit(
+            self._write_version,
+            module,
+            name,
+            extension,
+            # Values are shared, not copied
+            df.copy(deep=False),
+            fingerprint,
+            timestamp,
+            partition_on,
+        )
+        with self._pending_writes_lock:
+            self._pending_writes.setdefault(key, {})[future] = (extension, fingerprint)
+
+    def flush(self, raise_errors: bool = True):
+        """
+        Waits for all the background writes
+
+        Parameters
+        ----------
+        raise_errors: bool, optional, default=True
+            Raise the error of the first failed write. Errors are logged in any case
+        """
+        with self._pending_writes_lock:
+            futures = [f for fs in self._pending_writes.values() for f in fs]
+            self._pending_writes = {}
+        wait(futures)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        for error in errors:
+            self._log.error(f"Background cache write failed: {error!r}")
+        if errors and raise_errors:
+            raise errors[0]
+
+    def _wait_for_write(self, key: str):
+        with self._pending_writes_lock:
+            futures = list(self._pending_writes.pop(key, {}))
+        wait(futures)
+        # All the writes are waited for before raising the error of the first failed one
+        for future in futures:
+            future.result()
+
+    def _raise_failed_writes(self):
+        with self._pending_writes_lock:
+            failed = []
+            for key in list(self._pending_writes):
+                futures = self._pending_writes[key]
+                failed += [f for f in futures if f.done() and f.exception() is not None]
+                futures = {
+                    f: version for f, version in futures.items() if f not in failed
+                }
+                if futures:
+                    self._pending_writes[key] = futures
+                else:
+                    del self._pending_writes[key]
+        for future in failed[1:]:
+            self._log.error(f"Background cache write failed: {future.exception()!r}")
+        if failed:
+            failed[0].result()
+
+    def _write_version(
+        self,
+        module: str,
+        name: str,
+        extension: str,
+        obj,
+        fingerprint,
+        timestamp: str,
+        partition_on: str = None,
+    ):
+        root = self.prod_cache_root if self._to_prod else self.local_cache_root
         if self._to_prod:
             cache_dir = self.make_cache_path(module, name, "prod")
         else:
@@ -89,20 +447,47 @@ class Cache(object):
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir, exist_ok=True)
 
-        filename = "_".join([name, self._config.general["timestamp"]]) + "." + extension
+        filename = "_".join([name, timestamp]) + "." + extension
 
         full_path = os.path.join(cache_dir, filename)
+        # Written under another name, then renamed, so that readers never see a partial file
+        tmp_path = os.path.join(
+            cache_dir, f".tmp_{os.getpid()}_{threading.get_ident()}_{filename}"
+        )
+        key = self._manifest_key(module, name)
 
-        if extension == "csv":
-            df.to_csv(full_path, **self._write_kwargs.get("csv", {}))
-        elif extension in ["xls", "xlsx"]:
-            df.to_excel(full_path, **self._write_kwargs.get("xlsx", {}))
-        elif extension == "parquet":
-            df.to_parquet(full_path, **self._write_kwargs.get("parquet", {}))
-        elif extension == "dill":
-            save_pickle(predictor, full_path)
-        else:
-            raise NotImplementedError
+        start_time = time.perf_counter()
+        try:
+            # Written without lock, so that readers of the object are not blocked meanwhile
+            self.write_file(obj, tmp_path, extension, partition_on)
+            entry = {
+                "filename": filename,
+                "timestamp": timestamp,
+                "extension": extension,
+                "size_bytes": os.path.getsize(tmp_path),
+                "checksum": hash_file(tmp_path),
+                "fingerprint": fingerprint,
+            }
+            with file_lock(os.path.join(cache_dir, LOCK_FILENAME)):
+                os.replace(tmp_path, full_path)
+                with file_lock(os.path.join(root, MANIFEST_LOCK_FILENAME)):
+                    # Lists of versions are replaced, not modified, see `_read_manifest`
+                    manifest = dict(self._read_manifest(root, locked=True))
+                    entries = [
+                        e for e in manifest.get(key, []) if e["filename"] != filename
+                    ]
+                    manifest[key] = sorted(
+                        entries + [entry],
+                        key=lambda e: (e["timestamp"], e["filename"]),
+                    )
+                    self._apply_retention(root, manifest, key)
+                    self._write_manifest(root, manifest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._stats.record_write(
+            key, entry["size_bytes"], time.perf_counter() - start_time
+        )
 
         self._log.info(
             f"Cached {name} to {'prod' if self._to_prod else 'local'} under {full_path} "
@@ -115,18 +500,271 @@ class Cache(object):
         return os.path.join(root, module, name)
 
     def has_cache(self, module: str, name: str, mode: str):
+        return self._get_latest_entry(module, name, mode) is not None
 
-        path = self.make_cache_path(module, name, mode)
-        if os.path.exists(path) and len(os.listdir(path)) > 0:
-            return True
-        return False
-
-    def get_cache_from_path(self, cache_dir, name, extension):
-        filename = get_latest_in_directory(path=cache_dir, file_start=name)
+    def get_cache_from_path(
+        self, cache_dir, name, extension, filename=None, columns=None, filters=None
+    ):
+        if filename is None:
+            filename = get_latest_in_directory(
+                path=cache_dir, file_start=name, extension="." + extension
+            )
+            # Cache of another format
+            if filename is None:
+                return None
         full_path = os.path.join(cache_dir, filename)
 
         self._log.info(f"Using latest cached {filename}")
+        return self.read_file(full_path, extension, columns, filters)
+
+    # ---------------------------------- Manifest -------------------------------------------------------------------- #
+
+    @staticmethod
+    def _manifest_key(module: str, name: str) -> str:
+        return f"{module}/{name}"
+
+    def _get_latest_entry(
+        self,
+        module: str,
+        name: str,
+        mode: str,
+        extension: str = None,
+        fingerprint: str = None,
+    ):
+        """
+        Latest entry of the manifest for `module` / `name`, optionally of a given extension and
+        fingerprint. None if there is no such entry
+        """
+        root = self.local_cache_root if mode == "local" else self.prod_cache_root
+        entries = self._read_manifest(root).get(self._manifest_key(module, name), [])
+        for entry in reversed(entries):
+            if (extension is None or entry["extension"] == extension) and (
+                fingerprint is None or entry["fingerprint"] == fingerprint
+            ):
+                return entry
+        return None
+
+    def _read_manifest(self, root, locked: bool = False) -> dict:
+        """
+        Reads the manifest of a cache root, mapping each `module/name` to its cached versions
+        sorted from oldest to latest. The parsed manifest is kept until the file is replaced, and
+        shared with the callers, which must not modify it.
+        `locked` tells whether the caller holds the manifest lock, to save a new version
+        """
+        path = os.path.join(root, MANIFEST_FILENAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if not os.path.isdir(root):
+                return {}
+            if locked:
+                # Written by the caller, with the new version
+                return self._build_manifest(root)
+            # Only built in memory, as the cache root may be read-only. It is written by the
+            # next save to the cache root
+            cached = self._manifests.get(root)
+            if cached is None or cached[0] is not None:
+                cached = (None, self._build_manifest(root))
+                self._manifests[root] = cached
+            return cached[1]
+
+        # Manifests are replaced by renaming a new file, which changes the inode even when the
+        # modification time is too coarse to change
+        file_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._manifests.get(root)
+        if cached is not None and cached[0] == file_key:
+            return cached[1]
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        self._manifests[root] = (file_key, manifest)
+        return manifest
+
+    def _write_manifest(self, root, manifest: dict):
+        """
+        Writes the manifest of a cache root to a temporary file, then renames it, so that readers
+        never see a partially written manifest
+        """
+        path = os.path.join(root, MANIFEST_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _build_manifest(self, root) -> dict:
+        """
+        Builds the manifest of a cache root written before manifests existed, by scanning it.
+        Files are not read, their checksums being left unknown
+        """
+        self._log.info(f"Building cache manifest of {root}")
+        manifest = {}
+        for module in sorted(os.listdir(root)):
+            if not os.path.isdir(os.path.join(root, module)):
+                continue
+            for name in sorted(os.listdir(os.path.join(root, module))):
+                cache_dir = os.path.join(root, module, name)
+                entries = []
+                for filename in sorted(os.listdir(cache_dir)):
+                    if not filename.startswith(name + "_") or "." not in filename:
+                        continue
+                    timestamp, extension = filename[len(name) + 1 :].rsplit(".", 1)
+                    entries.append(
+                        {
+                            "filename": filename,
+                            "timestamp": timestamp,
+                            "extension": extension,
+                            "size_bytes": os.path.getsize(
+                                os.path.join(cache_dir, filename)
+                            ),
+                            "checksum": None,
+                            "fingerprint": None,
+                        }
+                    )
+                if entries:
+                    manifest[self._manifest_key(module, name)] = entries
+        return manifest
+
+    def _apply_retention(self, root, manifest: dict, saved_key: str):
+        """
+        Deletes the versions of `saved_key` beyond the last `keep_last` ones, then the oldest
+        versions of the cache root until it fits in `max_disk_mb`. The latest version of an object
+        is never deleted, nor are the versions of objects being read or written. The caller holds
+        the lock of `saved_key`. `manifest` is updated in place
+        """
+        keep_last = self._retention["keep_last"]
+        if keep_last is not None:
+            for entry in manifest[saved_key][:-keep_last]:
+                self._delete_version(root, manifest, saved_key, entry)
+
+        max_disk_mb = self._retention["max_disk_mb"]
+        if max_disk_mb is None:
+            return
+        # Latest versions count in the budget, but are not candidates for deletion
+        num_bytes = sum(e["size_bytes"] for es in manifest.values() for e in es)
+        versions = sorted(
+            (
+                (entry["timestamp"], key, entry)
+                for key, entries in manifest.items()
+                for entry in entries[:-1]
+            ),
+            key=lambda v: v[:2],
+        )
+        for _, key, entry in versions:
+            if num_bytes <= max_disk_mb * 1e6:
+                break
+            if key == saved_key:
+                self._delete_version(root, manifest, key, entry)
+            else:
+                lock_path = os.path.join(root, key, LOCK_FILENAME)
+                with file_lock(lock_path, blocking=False) as acquired:
+                    if not acquired:
+                        continue
+                    self._delete_version(root, manifest, key, entry)
+            num_bytes -= entry["size_bytes"]
+
+    def _delete_version(self, root, manifest: dict, key: str, entry: dict):
+        try:
+            os.remove(os.path.join(root, key, entry["filename"]))
+        except FileNotFoundError:
+            pass
+        manifest[key] = [e for e in manifest[key] if e is not entry]
+        self._log.info(f"Deleted cached {entry['filename']} from {root}")
+
+    def write_file(self, obj, full_path, extension: str, partition_on: str = None):
+        """
+        Writes a dataframe, or an object with the "dill" extension, in the given format
 
+        Parameters
+        ----------
+        obj: pd.DataFrame or object
+            Object to write
+        full_path: str
+            Path of the file
+        extension: str
+            Format of the file: "csv", "xlsx", "parquet", "feather" (Arrow IPC) or "dill"
+        partition_on: str, optional, default=None
+            Postal code column of the dataframe. In parquet, consecutive rows of the same
+            department are written in their own row group, so that reads filtered on the column
+            skip the other departments. Rows are best sorted by department beforehand
+        """
+        if extension == "csv":
+            obj.to_csv(full_path, **self._write_kwargs.get("csv", {}))
+        elif extension in ["xls", "xlsx"]:
+            obj.to_excel(full_path, **self._write_kwargs.get("xlsx", {}))
+        elif extension == "parquet" and partition_on is not None:
+            self._write_partitioned_parquet(obj, full_path, partition_on)
+        elif extension == "parquet":
+            obj.to_parquet(full_path, **self._write_kwargs.get("parquet", {}))
+        elif extension == "feather":
+            self._write_arrow_file(obj, full_path)
+        elif extension == "dill":
+            save_pickle(obj, full_path)
+        else:
+            raise NotImplementedError
+
+    def read_file(
+        self, full_path, extension: str, columns: list = None, filters: dict = None
+    ):
+        """
+        Reads a file written by `write_file`
+
+        Parameters
+        ----------
+        full_path: str
+            Path of the file
+        extension: str
+            Format of the file
+        columns: list, optional, default=None
+            Columns to read, all if None
+        filters: dict, optional, default=None
+            Values of the rows to read, as a mapping of columns to lists of values. In parquet,
+            only the row groups which can hold these values are read, and only the requested
+            columns
+
+        Returns
+        -------
+        pd.DataFrame or object
+            Content of the file
+        """
+        content = self._read_content(full_path, extension, columns, filters)
+        return self._parse_content(content, extension, columns, filters)
+
+    def _read_content(
+        self, full_path, extension: str, columns: list = None, filters: dict = None
+    ):
+        """
+        Reads a file without deserializing it: an Arrow table for parquet and feather, the bytes
+        of the file otherwise. See `_parse_content`
+        """
+        if extension in ["csv", "xlsx"]:
+            with open(full_path, "rb") as f:
+                return f.read()
+        elif extension == "parquet" and (columns is not None or filters is not None):
+            return self._read_parquet_selection(full_path, columns, filters)
+        elif extension == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.read_table(
+                full_path,
+                use_pandas_metadata=True,
+                **self._read_kwargs.get(extension, {}),
+            )
+        elif extension == "feather":
+            import pyarrow as pa
+
+            # Memory-mapped, so that columns are not copied to memory before conversion:
+            # pages of the file are then read while the table is converted
+            return pa.RecordBatchFileReader(pa.memory_map(full_path, "r")).read_all()
+        elif extension == "dill":
+            return read_buffer(full_path)
+        else:
+            raise NotImplementedError
+
+    def _parse_content(
+        self, content, extension: str, columns: list = None, filters: dict = None
+    ):
+        """
+        Deserializes the content of a file read by `_read_content`
+        """
         read_kwargs = self._read_kwargs.get(extension, {}).copy()
         if "parse_dates" in read_kwargs:
             date_cols = read_kwargs.pop("parse_dates")
@@ -134,17 +772,20 @@ class Cache(object):
             date_cols = []
 
         if extension == "csv":
-            df = pd.read_csv(full_path, **read_kwargs)
+            df = pd.read_csv(io.BytesIO(content), **read_kwargs)
         elif extension == "xlsx":
-            df = pd.read_excel(full_path, **read_kwargs)
+            df = pd.read_excel(io.BytesIO(content), **read_kwargs)
         elif extension == "parquet":
-            df = pd.read_parquet(full_path, **read_kwargs)
+            df = content.to_pandas()
+        elif extension == "feather":
+            df = content.to_pandas(**read_kwargs)
         elif extension == "dill":
-            predictor = load_pickle(full_path)
+            return loads_pickle(content)
         else:
             raise NotImplementedError
 
-        if extension != "dill":
+        # Columnar formats keep the types of the columns
+        if extension in ["csv", "xlsx"]:
             for col in set(date_cols).intersection(set(df.columns)):
                 try:
                     df[col] = pd.to_datetime(df[col])
@@ -153,9 +794,260 @@ class Cache(object):
                         f"Could not convert column to {col} when reading from cache"
                     )
 
-        if extension == "dill":
-            out = predictor
-        else:
-            out = df
+        return select_rows_columns(df, columns, filters)
+
+    @staticmethod
+    def _write_arrow_file(df: pd.DataFrame, full_path):
+        """
+        Writes an Arrow IPC file, i.e. Feather V2. `DataFrame.to_feather` writes Feather V1
+        files with pyarrow < 0.17, which cannot be memory-mapped as Arrow IPC files
+        """
+        import pyarrow as pa
+
+        # The index is not kept, as in `to_feather`
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(full_path, "wb") as sink:
+            writer = pa.RecordBatchFileWriter(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+
+    def _write_partitioned_parquet(
+        self, df: pd.DataFrame, full_path, partition_on: str
+    ):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # The index is stored as a column, as a range index cannot be rebuilt from some of the
+        # row groups
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        departments = get_departments(df[partition_on]).values
+        starts = np.flatnonzero(departments[1:] != departments[:-1]) + 1
+        bounds = np.concatenate([[0], starts, [df.shape[0]]])
+        with pq.ParquetWriter(
+            full_path, table.schema, **self._write_kwargs.get("parquet", {})
+        ) as writer:
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                writer.write_table(table.slice(start, end - start))
+
+    def _read_parquet_selection(self, full_path, columns: list, filters: dict):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(full_path)
+        filters = {
+            column: values if isinstance(values, (list, tuple, set)) else [values]
+            for column, values in (filters or {}).items()
+        }
+        read_columns = None
+        if columns is not None:
+            read_columns = list(columns) + [c for c in filters if c not in columns]
+
+        row_groups = [
+            i
+            for i in range(parquet_file.num_row_groups)
+            if _row_group_matches(parquet_file, i, filters)
+        ]
+        tables = [
+            parquet_file.read_row_group(
+                i, columns=read_columns, use_pandas_metadata=True
+            )
+            for i in row_groups
+        ]
+        if not tables:
+            # Empty selection, with the columns and types of the file
+            schema = parquet_file.schema.to_arrow_schema()
+            tables = [pa.Table.from_batches([], schema=schema)]
+        return pa.concat_tables(tables)
+
+
+def _row_group_matches(parquet_file, row_group: int, filters: dict) -> bool:
+    """
+    Whether the statistics of a row group allow it to hold the filtered values
+    """
+    metadata = parquet_file.metadata.row_group(row_group)
+    column_positions = {
+        metadata.column(i).path_in_schema: i for i in range(metadata.num_columns)
+    }
+    for column, values in filters.items():
+        if column not in column_positions:
+            continue
+        statistics = metadata.column(column_positions[column]).statistics
+        if statistics is None or not statistics.has_min_max:
+            continue
+        try:
+            if not any(statistics.min <= v <= statistics.max for v in values):
+                return False
+        # Values of another type than the column
+        except TypeError:
+            continue
+    return True
+
+
+def select_rows_columns(
+    df: pd.DataFrame, columns: list = None, filters: dict = None
+) -> pd.DataFrame:
+    """
+    Selects the rows of a dataframe matching filters, and some of its columns
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Dataframe to select from
+    columns: list, optional, default=None
+        Columns to keep, all if None
+    filters: dict, optional, default=None
+        Values of the rows to keep, as a mapping of columns to values or lists of values
+
+    Returns
+    -------
+    pd.DataFrame
+        Selection of `df`
+    """
+    if filters:
+        mask = np.ones(df.shape[0], dtype=bool)
+        for column, values in filters.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            mask &= df[column].isin(values).values
+        df = df[mask]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+class MemoryTier(object):
+    """
+    In-memory tier of the cache: keeps the most recently used objects up to a total size, the
+    least recently used ones being evicted beyond it
+    """
+
+    def __init__(self, max_bytes: float = None):
+        """
+        Parameters
+        ----------
+        max_bytes: float, optional, default=None
+            Total size of the objects kept in memory, unbounded if None
+        """
+        self._log = logging.getLogger(__name__)
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, obj, num_bytes: int):
+        """
+        Parameters
+        ----------
+        key: hashable
+            Key of the object
+        obj: object
+            Object to keep in memory
+        num_bytes: int
+            Size of the object. Objects larger than the tier are not kept
+        """
+        with self._lock:
+            self._pop(key)
+            if self._max_bytes is not None and num_bytes > self._max_bytes:
+                return
+            self._entries[key] = (obj, num_bytes)
+            self._num_bytes += num_bytes
+            while self._max_bytes is not None and self._num_bytes > self._max_bytes:
+                evicted_key = next(iter(self._entries))
+                self._pop(evicted_key)
+                self._log.debug(f"Evicted {evicted_key} from memory")
+
+    def discard(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        if key in self._entries:
+            self._num_bytes -= self._entries.pop(key)[1]
+
+
+class CacheStats(object):
+    """
+    Thread-safe counters of the cache, per `module/name`
+    """
+
+    TIERS = ["memory", "local", "prod"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+
+    def record_hit(self, key: str, tier: str):
+        with self._lock:
+            self._get(key)["hits"][tier] += 1
+
+    def record_miss(self, key: str):
+        with self._lock:
+            self._get(key)["misses"] += 1
+
+    def record_shared_read(self, key: str):
+        with self._lock:
+            self._get(key)["shared_reads"] += 1
+
+    def record_read(self, key: str, num_bytes: int, read_s: float, parse_s: float):
+        with self._lock:
+            stats = self._get(key)
+            stats["num_reads"] += 1
+            stats["bytes_read"] += num_bytes
+            stats["read_s"] += read_s
+            stats["parse_s"] += parse_s
+
+    def record_write(self, key: str, num_bytes: int, write_s: float):
+        with self._lock:
+            stats = self._get(key)
+            stats["num_writes"] += 1
+            stats["bytes_written"] += num_bytes
+            stats["write_s"] += write_s
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            objects = copy.deepcopy(self._objects)
+        totals = self._new_stats()
+        for stats in objects.values():
+            for tier in self.TIERS:
+                totals["hits"][tier] += stats["hits"][tier]
+            for name, value in stats.items():
+                if name != "hits":
+                    totals[name] += value
+        for stats in list(objects.values()) + [totals]:
+            num_lookups = sum(stats["hits"].values()) + stats["misses"]
+            stats["hit_ratio"] = (
+                sum(stats["hits"].values()) / num_lookups if num_lookups else None
+            )
+        return {"totals": totals, "objects": objects}
+
+    def _get(self, key: str) -> dict:
+        if key not in self._objects:
+            self._objects[key] = self._new_stats()
+        return self._objects[key]
 
-        return out
+    @classmethod
+    def _new_stats(cls) -> dict:
+        return {
+            "hits": {tier: 0 for tier in cls.TIERS},
+            "misses": 0,
+            # Reads served by the concurrent read of another thread
+            "shared_reads": 0,
+            "num_reads": 0,
+            "bytes_read": 0,
+            "read_s": 0.0,
+            "parse_s": 0.0,
+            "num_writes": 0,
+            "bytes_written": 0,
+            "write_s": 0.0,
+        }
@@ -0,0 +1,285 @@
+import io
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+log = logging.getLogger(__name__)
+
+
+def bulk_replace_table(
+    df: pd.DataFrame,
+    table: str,
+    engine,
+    indexes: dict = None,
+    version: str = None,
+    chunksize: int = 10000,
+    key_columns: list = None,
+):
+    """
+    Replaces the content of a table, without readers ever seeing a partially written table.
+    Rows are bulk loaded into a staging table (`COPY FROM STDIN` on PostgreSQL, chunked
+    `executemany` otherwise), the indexes are built on the staging table, and it is then swapped
+    with the live table in a single transaction.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Rows to upload. The index of the dataframe is not uploaded
+    table: str
+        Name of the table to replace
+    engine: sqlalchemy.engine.Engine
+        Engine to the database
+    indexes: dict, optional, default=None
+        Indexes to create, as a mapping of index names to lists of columns
+    version: str, optional, default=None
+        Suffix of the index names, so that indexes of the new table do not collide with the ones
+        of the live table. Defaults to current time
+    chunksize: int, optional, default=10000
+        Number of rows sent to the database at once
+    key_columns: list, optional, default=None
+        Columns identifying a row. When given, the hashes of the rows are saved in the manifest
+        table `<table>_manifest`, swapped in with the table, so that the next uploads can be
+        incremental with `upsert_table`
+    """
+    start_time = time.time()
+    version = version or str(int(start_time))
+
+    staging = [(df, table, indexes)]
+    swap = []
+    if key_columns and df.duplicated(key_columns).any():
+        log.warning(
+            f"Duplicated {key_columns} in rows uploaded to '{table}', the next upload will "
+            "not be incremental"
+        )
+        swap.append(f'drop table if exists "{_manifest(table)}"')
+    elif key_columns:
+        staging.append(
+            (_row_hashes(df, key_columns), _manifest(table), {"key": key_columns})
+        )
+    for rows, name, name_indexes in staging:
+        swap += _load_staging_table(
+            rows, name, engine, name_indexes, version, chunksize
+        )
+    _execute(engine, swap)
+
+    log.info(
+        f"Uploaded {df.shape[0]} rows to '{table}' in {time.time() - start_time:.2f}s"
+    )
+
+
+def upsert_table(
+    df: pd.DataFrame,
+    table: str,
+    engine,
+    key_columns: list,
+    indexes: dict = None,
+    version: str = None,
+    chunksize: int = 10000,
+) -> dict:
+    """
+    Uploads the difference between `df` and the previous upload of a table: rows are hashed and
+    compared with the manifest of the previous upload, and only the inserted, updated and deleted
+    rows are written, in a single transaction.
+    Falls back to `bulk_replace_table` when there is no manifest yet, or when the key columns do
+    not identify the rows of `df`.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Rows to upload. The index of the dataframe is not uploaded
+    table: str
+        Name of the table to update
+    engine: sqlalchemy.engine.Engine
+        Engine to the database
+    key_columns: list
+        Columns identifying a row
+    indexes: dict, optional, default=None
+        Indexes of the table, only created on a full upload. See `bulk_replace_table`
+    version: str, optional, default=None
+        See `bulk_replace_table`
+    chunksize: int, optional, default=10000
+        Number of rows sent to the database at once
+
+    Returns
+    -------
+    dict
+        Number of rows inserted, updated and deleted
+    """
+    start_time = time.time()
+    existing_tables = inspect(engine).get_table_names()
+    full_upload = {"inserted": df.shape[0], "updated": 0, "deleted": 0}
+    if (
+        table not in existing_tables
+        or _manifest(table) not in existing_tables
+        or df.duplicated(key_columns).any()
+    ):
+        log.info(
+            f"Cannot diff with the previous upload of '{table}', uploading all rows"
+        )
+        bulk_replace_table(df, table, engine, indexes, version, chunksize, key_columns)
+        return full_upload
+
+    df = df.reset_index(drop=True)
+    hashes = _row_hashes(df, key_columns)
+    previous_hashes = pd.read_sql_query(f'select * from "{_manifest(table)}"', engine)
+    diff = hashes.assign(position=range(df.shape[0])).merge(
+        previous_hashes,
+        on=key_columns,
+        how="outer",
+        suffixes=("", "_previous"),
+        indicator=True,
+    )
+    inserted = diff["_merge"] == "left_only"
+    deleted = diff["_merge"] == "right_only"
+    updated = (diff["_merge"] == "both") & (
+        diff["row_hash"] != diff["row_hash_previous"]
+    )
+
+    # Updated rows are deleted and inserted again
+    removed_keys = diff.loc[deleted | updated, key_columns]
+    added_positions = diff.loc[inserted | updated, "position"].astype(int).values
+    with engine.begin() as connection:
+        for name, added_rows in [
+            (table, df.take(added_positions)),
+            (_manifest(table), hashes.take(added_positions)),
+        ]:
+            _delete(connection, removed_keys, name, chunksize)
+            _insert(connection, added_rows, name, chunksize)
+
+    counts = {
+        "inserted": int(inserted.sum()),
+        "updated": int(updated.sum()),
+        "deleted": int(deleted.sum()),
+    }
+    log.info(
+        f"Uploaded changes to '{table}' in {time.time() - start_time:.2f}s: "
+        f"{counts['inserted']} inserted, {counts['updated']} updated, "
+        f"{counts['deleted']} deleted rows"
+    )
+    return counts
+
+
+def _manifest(table: str) -> str:
+    return f"{table}_manifest"
+
+
+def _row_hashes(df: pd.DataFrame, key_columns: list) -> pd.DataFrame:
+    hashes = df[key_columns].reset_index(drop=True)
+    # Signed, as databases have no unsigned 64 bits integers
+    hashes["row_hash"] = pd.util.hash_pandas_object(df, index=False).values.view(
+        np.int64
+    )
+    return hashes
+
+
+def _load_staging_table(
+    df: pd.DataFrame, table: str, engine, indexes: dict, version: str, chunksize: int
+) -> list:
+    """
+    Loads `df` in the staging table of `table` and indexes it
+
+    Returns
+    -------
+    list
+        Statements swapping the staging table with the live table
+    """
+    staging_table = f"{table}__staging"
+    old_table = f"{table}__old"
+
+    # Leftover of a failed upload
+    _execute(engine, [f'drop table if exists "{staging_table}"'])
+    df.head(0).to_sql(staging_table, engine, index=False)
+
+    if engine.dialect.name == "postgresql":
+        _copy_from_stdin(df, staging_table, engine, chunksize)
+    else:
+        with engine.begin() as connection:
+            _insert(connection, df, staging_table, chunksize)
+
+    _execute(
+        engine,
+        [
+            f'create index "ix_{table}_{name}_{version}" on "{staging_table}" '
+            f"({', '.join(columns)})"
+            for name, columns in (indexes or {}).items()
+        ],
+    )
+
+    swap = [f'alter table "{staging_table}" rename to "{table}"']
+    if table in inspect(engine).get_table_names():
+        swap = [
+            f'drop table if exists "{old_table}"',
+            f'alter table "{table}" rename to "{old_table}"',
+        ] + swap
+        swap.append(f'drop table "{old_table}"')
+    return swap
+
+
+def _execute(engine, statements: list):
+    """
+    Executes statements in a single transaction
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == "sqlite":
+            # pysqlite does not open a transaction before DDL statements by itself
+            cursor.execute("begin")
+        for statement in statements:
+            cursor.execute(statement)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def _copy_from_stdin(df: pd.DataFrame, table: str, engine, chunksize: int):
+    columns = ", ".join(f'"{c}"' for c in df.columns)
+    statement = f'copy "{table}" ({columns}) from stdin with (format csv)'
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Rows are streamed chunk by chunk, so that the whole CSV is never held in memory
+        for start in range(0, df.shape[0], chunksize):
+            buffer = io.StringIO()
+            df.iloc[start : start + chunksize].to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def _insert(connection, df: pd.DataFrame, table: str, chunksize: int):
+    columns = ", ".join(f'"{c}"' for c in df.columns)
+    params = [f"c{i}" for i in range(df.shape[1])]
+    statement = text(
+        f'insert into "{table}" ({columns}) values ({", ".join(":" + p for p in params)})'
+    )
+    for start in range(0, df.shape[0], chunksize):
+        chunk = df.iloc[start : start + chunksize]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        connection.execute(
+            statement, [dict(zip(params, row)) for row in chunk.values.tolist()]
+        )
+
+
+def _delete(connection, keys: pd.DataFrame, table: str, chunksize: int):
+    params = [f"c{i}" for i in range(keys.shape[1])]
+    statement = text(
+        f'delete from "{table}" where '
+        + " and ".join(f'"{c}" = :{p}' for c, p in zip(keys.columns, params))
+    )
+    for start in range(0, keys.shape[0], chunksize):
+        chunk = keys.iloc[start : start + chunksize].astype(object)
+        connection.execute(
+            statement, [dict(zip(params, row)) for row in chunk.values.tolist()]
+        )
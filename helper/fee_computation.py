@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+
+def compute_fee(agency_rate, agency_fee_min_keuros, price_keuros):
+    """
+    Computes agency fees: the rate of the agency applied to the price, or the minimum fee of the
+    agency when it has no rate. All inputs can be scalars or broadcastable arrays
+
+    Parameters
+    ----------
+    agency_rate: array-like
+        Rate of the agencies, NaN / None when the agency only has a minimum fee
+    agency_fee_min_keuros: array-like
+        Minimum fee of the agencies in k€
+    price_keuros: array-like
+        Price of the properties in k€
+
+    Returns
+    -------
+    np.ndarray
+        Agency fees in k€
+    """
+    agency_rate = np.asarray(agency_rate, dtype=float)
+    return np.where(
+        np.isnan(agency_rate),
+        np.asarray(agency_fee_min_keuros, dtype=float),
+        agency_rate * np.asarray(price_keuros, dtype=float),
+    )
+
+
+def tier_upper_bounds(agency_codes, price_min_keuros) -> np.ndarray:
+    """
+    Computes the upper bound of each tier, i.e. the lower bound of the next tier of the same agency.
+    The last tier of an agency is open-ended, and gets an upper bound of NaN
+
+    Parameters
+    ----------
+    agency_codes: array-like
+        Agency of each tier
+    price_min_keuros: array-like
+        Lower bound of each tier in k€
+
+    Returns
+    -------
+    np.ndarray
+        Upper bound of each tier in k€, in the same order as the inputs
+    """
+    agency_ids = pd.factorize(np.asarray(agency_codes))[0]
+    price_min_keuros = np.asarray(price_min_keuros, dtype=float)
+    order = np.lexsort((price_min_keuros, agency_ids))
+
+    sorted_upper_bounds = np.full(len(order), np.nan)
+    sorted_upper_bounds[:-1] = price_min_keuros[order][1:]
+    is_last_tier = np.ones(len(order), dtype=bool)
+    is_last_tier[:-1] = agency_ids[order][1:] != agency_ids[order][:-1]
+    sorted_upper_bounds[is_last_tier] = np.nan
+
+    upper_bounds = np.empty(len(order))
+    upper_bounds[order] = sorted_upper_bounds
+    return upper_bounds
+
+
+class FeeSchedule(object):
+    """
+    Fee schedules of a set of agencies, evaluated with NumPy over many prices at once.
+
+    The tiers of each agency are stored in padded (agencies x tiers) arrays sorted by lower bound,
+    so that finding the tier of every (agency, price) pair is a comparison against at most
+    `max_tiers` columns, independently of the number of agencies and prices.
+    """
+
+    def __init__(self, agency_fees: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        agency_fees: pd.DataFrame
+            One row per tier, with columns `agency_code`, `price_min_keuros`, `agency_rate`,
+            `agency_fee_min_keuros` and optionally `price_max_keuros`. When the upper bounds
+            are missing, they are derived from the lower bound of the next tier of the agency.
+            NaN upper bounds are open-ended
+        """
+        agency_ids, agency_codes = pd.factorize(agency_fees["agency_code"].values)
+        price_min = agency_fees["price_min_keuros"].values.astype(float)
+        if "price_max_keuros" in agency_fees.columns:
+            price_max = agency_fees["price_max_keuros"].values.astype(float)
+        else:
+            price_max = tier_upper_bounds(agency_ids, price_min)
+        price_max = np.where(np.isnan(price_max), np.inf, price_max)
+
+        order = np.lexsort((price_min, agency_ids))
+        agency_ids = agency_ids[order]
+        n_tiers = np.bincount(agency_ids, minlength=len(agency_codes))
+        tier_ranks = np.arange(len(order)) - np.repeat(
+            np.cumsum(n_tiers) - n_tiers, n_tiers
+        )
+        shape = (len(agency_codes), n_tiers.max() if len(order) > 0 else 0)
+
+        def pad(values, fill_value):
+            padded = np.full(shape, fill_value, dtype=float)
+            padded[agency_ids, tier_ranks] = values[order]
+            return padded
+
+        self._agency_codes = np.asarray(agency_codes)
+        self._rows = np.full(shape, -1, dtype=np.int64)
+        self._rows[agency_ids, tier_ranks] = order
+        self._price_min = pad(price_min, np.inf)
+        self._price_max = pad(price_max, -np.inf)
+        self._rate = pad(agency_fees["agency_rate"].values.astype(float), np.nan)
+        self._fee_min = pad(
+            agency_fees["agency_fee_min_keuros"].values.astype(float), np.nan
+        )
+
+    @property
+    def agency_codes(self) -> np.ndarray:
+        return self._agency_codes
+
+    @property
+    def max_tiers(self) -> int:
+        return self._price_min.shape[1]
+
+    def evaluate(self, prices_keuros) -> np.ndarray:
+        """
+        Evaluates the fee of every agency for every price
+
+        Parameters
+        ----------
+        prices_keuros: array-like
+            Prices in k€
+
+        Returns
+        -------
+        np.ndarray
+            (agencies x prices) array of fees in k€, NaN where no tier of the agency applies to the
+            price. Rows follow `agency_codes`
+        """
+        prices_keuros = np.asarray(prices_keuros, dtype=float)
+        agencies = np.arange(len(self._agency_codes))[:, None]
+        return self._evaluate(agencies, prices_keuros[None, :])
+
+    def evaluate_pairs(self, agency_positions, prices_keuros) -> np.ndarray:
+        """
+        Evaluates the fee of (agency, price) pairs
+
+        Parameters
+        ----------
+        agency_positions: array-like
+            Position of the agencies in `agency_codes`
+        prices_keuros: array-like
+            Prices in k€, one per agency position
+
+        Returns
+        -------
+        np.ndarray
+            Fees in k€, NaN where no tier of the agency applies to the price
+        """
+        return self._evaluate(
+            np.asarray(agency_positions, dtype=np.int64),
+            np.asarray(prices_keuros, dtype=float),
+        )
+
+    def find_tiers(self, agency_positions, prices_keuros) -> np.ndarray:
+        """
+        Finds the tier applying to (agency, price) pairs
+
+        Parameters
+        ----------
+        agency_positions: array-like
+            Position of the agencies in `agency_codes`
+        prices_keuros: array-like
+            Prices in k€, one per agency position
+
+        Returns
+        -------
+        np.ndarray
+            Position of the tiers in the `agency_fees` the schedule was built from, -1 where no
+            tier of the agency applies to the price
+        """
+        agencies = np.asarray(agency_positions, dtype=np.int64)
+        prices = np.asarray(prices_keuros, dtype=float)
+        tiers, applies = self._find_tiers(agencies, prices)
+        return np.where(applies, self._rows[agencies, tiers], -1)
+
+    def _find_tiers(self, agencies: np.ndarray, prices: np.ndarray):
+        # Tier of each pair = last tier starting at or below the price. Looping on tier columns
+        # keeps memory at one (agencies x prices) array whatever the number of tiers
+        tiers = np.full(np.broadcast(agencies, prices).shape, -1, dtype=np.int64)
+        for t in range(self.max_tiers):
+            tiers += self._price_min[agencies, t] <= prices
+        has_tier = tiers >= 0
+        tiers = np.maximum(tiers, 0)
+        if self.max_tiers == 0:
+            return tiers, has_tier
+        return tiers, has_tier & (self._price_max[agencies, tiers] > prices)
+
+    def _evaluate(self, agencies: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        if self.max_tiers == 0:
+            return np.full(np.broadcast(agencies, prices).shape, np.nan)
+
+        tiers, applies = self._find_tiers(agencies, prices)
+        fees = compute_fee(
+            self._rate[agencies, tiers], self._fee_min[agencies, tiers], prices
+        )
+        return np.where(applies, fees, np.nan)
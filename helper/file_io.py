@@ -1,9 +1,30 @@
+import contextlib
+import fcntl
+import logging
+import os
+import struct
+import threading
+
 import dill
 
+try:
+    # Backport of pickle protocol 5 to Python 3.7
+    import pickle5 as pickle
+except ImportError:
+    import pickle
+
+log = logging.getLogger(__name__)
+
+# Start of the files written by `save_pickle` with pickle, the others being written with dill
+PICKLE_MAGIC = b"IMMOPKL5"
+BUFFER_ALIGNMENT = 64
+
 
 def save_pickle(obj, path):
     """
-    Save obj to path as a pickle file
+    Save obj to path as a pickle file. Objects are pickled with protocol 5, the buffers of NumPy
+    arrays and pandas objects being written out-of-band, without copy. Objects which cannot be
+    pickled this way, e.g. lambdas, are pickled with dill
 
     Parameters
     ----------
@@ -12,14 +33,33 @@ def save_pickle(obj, path):
     path: str
         Path to dump pickle to
     """
-    pickle_out = open(path, "wb")
-    dill.dump(obj, pickle_out)
-    pickle_out.close()
+    buffers = []
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        dumps_kwargs = {"protocol": 5, "buffer_callback": buffers.append}
+    else:
+        dumps_kwargs = {"protocol": pickle.HIGHEST_PROTOCOL}
+    try:
+        data = pickle.dumps(obj, **dumps_kwargs)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        log.debug(f"Pickling with dill to {path}: {e}")
+        with open(path, "wb") as pickle_out:
+            dill.dump(obj, pickle_out)
+        return
+
+    buffers = [buffer.raw() for buffer in buffers]
+    with open(path, "wb") as pickle_out:
+        pickle_out.write(PICKLE_MAGIC)
+        pickle_out.write(struct.pack("<QQ", len(buffers), len(data)))
+        pickle_out.write(struct.pack(f"<{len(buffers)}Q", *[b.nbytes for b in buffers]))
+        pickle_out.write(data)
+        for buffer in buffers:
+            pickle_out.write(bytes(_padding(pickle_out.tell())))
+            pickle_out.write(buffer)
 
 
 def load_pickle(path):
     """
-    Load obj from pickle file
+    Load obj from pickle file written by `save_pickle`, or by dill
 
     Parameters
     ----------
@@ -31,7 +71,156 @@ def load_pickle(path):
     obj: object
         Object loaded from pickle
     """
-    pickle_in = open(path, "rb")
-    obj = dill.load(pickle_in)
-    pickle_in.close()
-    return obj
+    return loads_pickle(read_buffer(path))
+
+
+def read_buffer(path) -> bytearray:
+    """
+    Read a file at once in a writable buffer
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+
+    Returns
+    -------
+    bytearray
+        Content of the file
+    """
+    with open(path, "rb") as f:
+        content = bytearray(os.fstat(f.fileno()).st_size)
+        f.readinto(content)
+    return content
+
+
+def loads_pickle(content: bytearray):
+    """
+    Load obj from the content of a pickle file written by `save_pickle`, or by dill. The arrays
+    of the object share the buffer of the content, without copy
+
+    Parameters
+    ----------
+    content: bytearray
+        Content of the pickle file, see `read_buffer`
+
+    Returns
+    -------
+    obj: object
+        Object loaded from pickle
+    """
+    if content[: len(PICKLE_MAGIC)] != PICKLE_MAGIC:
+        return dill.loads(content)
+
+    start = len(PICKLE_MAGIC) + 16
+    num_buffers, data_size = struct.unpack_from("<QQ", content, len(PICKLE_MAGIC))
+    buffer_sizes = struct.unpack_from(f"<{num_buffers}Q", content, start)
+    start += 8 * num_buffers
+
+    content = memoryview(content)
+    buffers = []
+    offset = start + data_size
+    for size in buffer_sizes:
+        offset += _padding(offset)
+        buffers.append(content[offset : offset + size])
+        offset += size
+    if not buffers:
+        return pickle.loads(content[start : start + data_size])
+    return pickle.loads(content[start : start + data_size], buffers=buffers)
+
+
+def _padding(position: int) -> int:
+    # Buffers are aligned, for NumPy to operate on the arrays sharing them
+    return -position % BUFFER_ALIGNMENT
+
+
+class LazyArtifact(object):
+    """
+    Proxy to an object loaded on first use. Attributes of the object can be accessed on the
+    proxy, e.g. `index.query_radius(...)`; other uses, e.g. `len`, need the object itself,
+    returned by `load`
+    """
+
+    def __init__(self, loader):
+        """
+        Parameters
+        ----------
+        loader: callable
+            Function without arguments returning the object
+        """
+        self._loader = loader
+        self._obj = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        """
+        Loads the object, on first call only
+
+        Returns
+        -------
+        object
+            Object behind the proxy
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._obj = self._loader()
+                    self._loaded = True
+        return self._obj
+
+    def __getattr__(self, name):
+        # Attributes of the proxy itself, before they are set
+        if name in ["_loader", "_obj", "_loaded", "_lock"]:
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+@contextlib.contextmanager
+def file_lock(path, shared: bool = False, blocking: bool = True):
+    """
+    Advisory lock on a file, shared by the processes and threads using the same path.
+    Usage: `with file_lock(path) as acquired: ...`
+
+    Parameters
+    ----------
+    path: str
+        Path of the lock file, created if needed
+    shared: bool, optional, default=False
+        Take a shared (read) lock instead of an exclusive (write) lock
+    blocking: bool, optional, default=True
+        Wait for the lock. Otherwise, `acquired` is False when the lock is held by someone else
+
+    Yields
+    ------
+    acquired: bool
+        Whether the lock was acquired
+    """
+    # Shared locks do not need write access, e.g. on a read-only cache
+    mode = "r" if shared and os.path.exists(path) else "a"
+    try:
+        f = open(path, mode)
+    except OSError:
+        if not shared:
+            raise
+        # The lock file cannot be created, e.g. in a read-only cache, which is then read unlocked
+        log.debug(f"Could not create lock file {path}, reading without lock")
+        yield True
+        return
+    with f:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(
+                f.fileno(), operation if blocking else operation | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class PostalCodeNeighbourIndex(object):
+    """
+    Spatial index over postal code centroids, to find the postal codes close to a property.
+
+    Centroids are projected on the unit sphere, so that the euclidean distance in the KD-tree
+    (chord length) is a monotonic function of the great-circle distance.
+    """
+
+    def __init__(self, centroids: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        centroids: pd.DataFrame
+            One row per postal code, with columns `postal_code`, `latitude` and `longitude`
+            (in degrees)
+        """
+        centroids = centroids.sort_values("postal_code")
+        self._postal_codes = centroids["postal_code"].values.astype(np.int64)
+        latitude = np.radians(centroids["latitude"].values.astype(float))
+        longitude = np.radians(centroids["longitude"].values.astype(float))
+        self._points = np.column_stack(
+            [
+                np.cos(latitude) * np.cos(longitude),
+                np.cos(latitude) * np.sin(longitude),
+                np.sin(latitude),
+            ]
+        )
+        self._tree = cKDTree(self._points)
+
+    def __len__(self):
+        return len(self._postal_codes)
+
+    def query_radius(self, postal_code: int, radius_km: float):
+        """
+        Finds the postal codes whose centroid is within `radius_km` of the centroid of `postal_code`
+
+        Parameters
+        ----------
+        postal_code: int
+            Postal code of the property
+        radius_km: float
+            Search radius in km
+
+        Returns
+        -------
+        postal_codes: np.ndarray
+            Postal codes found, sorted by distance. Always contains `postal_code` itself
+        distances_km: np.ndarray
+            Great-circle distance between the centroids in km
+        """
+        point = self._get_point(postal_code)
+        if point is None:
+            return np.array([postal_code], dtype=np.int64), np.zeros(1)
+
+        chord = 2 * np.sin(min(radius_km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+        neighbours = np.asarray(self._tree.query_ball_point(point, chord), dtype=int)
+        return self._sort_by_distance(point, neighbours)
+
+    def query_knn(self, postal_code: int, k: int):
+        """
+        Finds the `k` postal codes whose centroid is the closest to the centroid of `postal_code`
+
+        Parameters
+        ----------
+        postal_code: int
+            Postal code of the property
+        k: int
+            Number of postal codes to return, including `postal_code` itself
+
+        Returns
+        -------
+        postal_codes: np.ndarray
+            Postal codes found, sorted by distance
+        distances_km: np.ndarray
+            Great-circle distance between the centroids in km
+        """
+        point = self._get_point(postal_code)
+        if point is None:
+            return np.array([postal_code], dtype=np.int64), np.zeros(1)
+
+        _, neighbours = self._tree.query(point, k=min(k, len(self)))
+        return self._sort_by_distance(point, np.atleast_1d(neighbours))
+
+    def _get_point(self, postal_code: int):
+        i = np.searchsorted(self._postal_codes, postal_code)
+        if i == len(self._postal_codes) or self._postal_codes[i] != postal_code:
+            return None
+        return self._points[i]
+
+    def _sort_by_distance(self, point: np.ndarray, neighbours: np.ndarray):
+        chords = np.linalg.norm(self._points[neighbours] - point, axis=1)
+        distances_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1))
+        order = np.argsort(distances_km, kind="mergesort")
+        return self._postal_codes[neighbours[order]], distances_km[order]
@@ -1,19 +1,24 @@
 import ast
 import collections
+import hashlib
 import logging
 import keyword
 import datetime
 import pathlib
 import shutil
 import time
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 import yaml
 import itertools
 import os
 import cProfile
 import pstats
+import importlib
 import io
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 log = logging.getLogger(__name__)
 
 
@@ -181,6 +186,70 @@ def get_latest_in_directory(path, file_start=None, extension=None):
     return latest
 
 
+def hash_file(path, block_size: int = 2 ** 20) -> str:
+    """
+    Computes the SHA-256 checksum of a file, reading it by blocks
+
+    Parameters
+    ----------
+    path: str
+        Path to the file
+    block_size: int, optional, default=2 ** 20
+        Number of bytes read at once
+
+    Returns
+    -------
+    str
+        Hexadecimal checksum
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_departments(postal_codes) -> "pd.Series":
+    """
+    Departments of postal codes, i.e. their first two digits
+
+    Parameters
+    ----------
+    postal_codes: array-like
+        Postal codes, as integers or strings
+
+    Returns
+    -------
+    pd.Series
+        Departments, as strings of two characters
+    """
+    # Not imported with the module, which the CLIs import before parsing their arguments
+    import pandas as pd
+
+    postal_codes = pd.Series(postal_codes)
+    if pd.api.types.is_float_dtype(postal_codes):
+        postal_codes = postal_codes.astype("Int64")
+    return postal_codes.astype(str).str.zfill(5).str[:2]
+
+
+def import_object(path: str):
+    """
+    Imports an object from its dotted path, e.g. "data.data.Data"
+
+    Parameters
+    ----------
+    path: str
+        Module of the object, followed by its name
+
+    Returns
+    -------
+    object
+        Imported object
+    """
+    module_name, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), name)
+
+
 def profileit(func):
     def wrapper(*args, **kwargs):
         datafn = func.__name__ + ".profile"  # Name the data file sensibly
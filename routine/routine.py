@@ -3,6 +3,7 @@ import logging
 import os
 import json
 
+from helper.cache import Cache
 from helper.logging import configure_logging
 from helper.utils import get_timestamp, json_serial, get_versioned_log_path
 from config.immo_config import ImmoConfig
@@ -29,6 +30,22 @@ class Routine(metaclass=abc.ABCMeta):
     def run_routine(self):
         pass
 
+    def run(self):
+        """
+        Runs the routine, then waits for the cache writes it left in the background, raising
+        their errors, and saves the statistics of the cache in `cache_stats.json`
+        """
+        cache = Cache(self._config)
+        try:
+            self.run_routine()
+        except Exception:
+            cache.flush(raise_errors=False)
+            raise
+        else:
+            cache.flush()
+        finally:
+            cache.save_stats(os.path.join(self._cwd, "cache_stats.json"))
+
     def _initialize(self, cwd_root: str, job_config: dict):
         # Make working directory
         cwd = os.path.join(cwd_root, "_".join([self.timestamp, self.name]))
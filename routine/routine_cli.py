@@ -4,7 +4,7 @@ import sys
 import logging
 from pathlib import Path
 
-from helper.utils import parse_params
+from helper.utils import import_object, parse_params
 
 
 def run_routine_from_cli(routines, default: str):
@@ -14,7 +14,9 @@ def run_routine_from_cli(routines, default: str):
     Parameters
     ----------
     routines: dict
-        Mapping of routines names and classes
+        Mapping of routines names and classes, or dotted paths of the classes, e.g.
+        "data.routines.etl_routine.EtlRoutine". Routines given by path are only imported when run,
+        so that the CLI does not import the dependencies of the other routines
     default: str
         Default routine to run
 
@@ -107,11 +109,20 @@ def run_routine_from_cli(routines, default: str):
         help="Server (true) or local (false) run (default: false)",
     )
 
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Only report what the routine would do (e.g. which ETLs would be recomputed)",
+    )
+
     args = parser.parse_args(sys.argv[1:])
 
     params = {}
     for s in args.params or []:
-        k, v = s.split(":")
+        # Values may contain ":" themselves (e.g. database URIs)
+        k, v = s.split(":", 1)
         params[k] = v
 
     # Default CWD set to home/tmp
@@ -127,6 +138,7 @@ def run_routine_from_cli(routines, default: str):
 
     job_config["logging"]["level"] = args.logging_level
     job_config["general"]["mode"] = "server" if args.server else "local"
+    job_config["general"]["dry_run"] = args.dry_run
 
     if args.local_cache_root:
         job_config["cache"]["root_local_relative_to_home"] = args.local_cache_root
@@ -134,10 +146,13 @@ def run_routine_from_cli(routines, default: str):
     job_config["cache"]["cache_from_prod"] = args.cache_from_prod
 
     if args.routine in routines:
-        routine = routines[args.routine](cwd, job_config, args.timestamp)
+        routine_class = routines[args.routine]
+        if isinstance(routine_class, str):
+            routine_class = import_object(routine_class)
+        routine = routine_class(cwd, job_config, args.timestamp)
     else:
         raise AttributeError(
             f"Unknown routine to run: '{args.routine}'. Must be one of {list(routines.keys())}"
         )
 
-    routine.run_routine()
+    routine.run()
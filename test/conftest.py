@@ -0,0 +1,14 @@
+import pytest
+
+from helper.cache import Cache
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """
+    Temporary home directory, holding the local cache root. The cache instance of a test is
+    discarded after it
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    yield tmp_path
+    Cache.reset_instance()
@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from config.immo_config import ImmoConfig
+from helper.cache import Cache, MemoryTier
+
+
+def open_cache(**cache_config) -> Cache:
+    """
+    New cache instance, writing synchronously unless `async_writes` is given
+    """
+    Cache.reset_instance()
+    return Cache(
+        ImmoConfig(
+            {
+                "general": {"local_data_root_from_home": "data"},
+                "cache": dict({"async_writes": False}, **cache_config),
+            }
+        )
+    )
+
+
+def save(cache: Cache, df: pd.DataFrame, timestamp: str, name="agencies", **kwargs):
+    cache._config.general["timestamp"] = timestamp
+    cache.save_to_cache(
+        "etl", name, kwargs.pop("extension", "parquet"), df=df, **kwargs
+    )
+
+
+def cached_files(cache: Cache, name="agencies") -> list:
+    cache_dir = cache.make_cache_path("etl", name, "local")
+    return sorted(f for f in os.listdir(cache_dir) if not f.startswith("."))
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "postal_code": [75001, 75002, 13001],
+            "city": pd.Categorical(["Paris", "Paris", "Marseille"]),
+            "score": [4.5, None, 3.0],
+        }
+    )
+
+
+@pytest.mark.parametrize("extension", ["csv", "parquet", "feather"])
+def test_save_and_read(df, extension):
+    save(open_cache(), df, "20210101_000000", extension=extension)
+
+    # Read from disk by a new cache, not from the memory of the previous one
+    read = open_cache().get_from_cache("etl", "agencies", extension)
+
+    if extension == "csv":
+        df = df.astype({"city": str})
+    pd.testing.assert_frame_equal(read, df)
+
+
+def test_retention_keeps_latest_versions_within_disk_budget(df):
+    # Budget smaller than any file: only the latest version of each object is kept
+    cache = open_cache(retention={"keep_last": None, "max_disk_mb": 1e-6})
+    for timestamp in ["20210101_000000", "20210102_000000"]:
+        save(cache, df, timestamp, name="agencies")
+        save(cache, df, timestamp, name="fees")
+
+    assert cached_files(cache, "agencies") == ["agencies_20210102_000000.parquet"]
+    assert cached_files(cache, "fees") == ["fees_20210102_000000.parquet"]
+
+
+def test_memory_tier_evicts_least_recently_used_objects():
+    memory = MemoryTier(max_bytes=25)
+    memory.put("a", "A", 10)
+    memory.put("b", "B", 10)
+    assert memory.get("a") == "A"
+
+    memory.put("c", "C", 10)
+
+    assert memory.get("b") is None
+    assert (memory.get("a"), memory.get("c")) == ("A", "C")
+    assert memory.num_bytes == 20
+    # Objects larger than the tier are not kept
+    memory.put("d", "D", 30)
+    assert memory.get("d") is None
+
+
+def test_manifest_lists_saved_versions(df):
+    cache = open_cache(retention={"keep_last": 2, "max_disk_mb": None})
+    for timestamp in ["20210101_000000", "20210102_000000", "20210103_000000"]:
+        save(cache, df, timestamp, fingerprint=timestamp)
+
+    cache = open_cache()
+    assert cached_files(cache) == [
+        "agencies_20210102_000000.parquet",
+        "agencies_20210103_000000.parquet",
+    ]
+    assert cache.exists_in_cache("etl", "agencies", fingerprint="20210102_000000")
+    assert not cache.exists_in_cache("etl", "agencies", fingerprint="20210101_000000")
+
+
+def test_read_legacy_root_without_writing_to_it(df):
+    cache = open_cache()
+    cache_dir = cache.make_cache_path("etl", "agencies", "local")
+    os.makedirs(cache_dir)
+    df.to_parquet(os.path.join(cache_dir, "agencies_20210101_000000.parquet"))
+
+    pd.testing.assert_frame_equal(
+        cache.get_from_cache("etl", "agencies", "parquet"), df
+    )
+    # The manifest is not written by reads, as the cache root may be read-only
+    assert os.listdir(cache.local_cache_root) == ["etl"]
+
+    # The manifest is written by the next save
+    save(cache, df, "20210102_000000", fingerprint="new")
+    cache = open_cache()
+    assert cache.exists_in_cache("etl", "agencies", fingerprint="new")
+    assert os.path.exists(os.path.join(cache.local_cache_root, "manifest.json"))
+    assert cache.has_cache("etl", "agencies", "local")
+
+
+def test_flush_raises_failed_background_writes(df, monkeypatch):
+    cache = open_cache(async_writes=True)
+    write_file = cache.write_file
+    saved = threading.Event()
+
+    def fail_first_write(obj, full_path, *args, **kwargs):
+        if "20210101" in full_path:
+            # Fails once the next version of the object is submitted
+            saved.wait()
+            raise OSError("disk full")
+        write_file(obj, full_path, *args, **kwargs)
+
+    monkeypatch.setattr(cache, "write_file", fail_first_write)
+    for timestamp in ["20210101_000000", "20210102_000000"]:
+        save(cache, df, timestamp)
+    saved.set()
+
+    with pytest.raises(OSError, match="disk full"):
+        cache.flush()
+    assert cached_files(cache) == ["agencies_20210102_000000.parquet"]
+
+
+def test_pending_write_exists_only_with_its_extension_and_fingerprint(df, monkeypatch):
+    cache = open_cache(async_writes=True)
+    write_file = cache.write_file
+    saved = threading.Event()
+
+    def write_once_checked(*args, **kwargs):
+        saved.wait(timeout=10)
+        write_file(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "write_file", write_once_checked)
+    save(cache, df, "20210101_000000", fingerprint="AAAA")
+    try:
+        assert cache.exists_in_cache("etl", "agencies", "parquet", "AAAA")
+        assert cache.exists_in_cache("etl", "agencies")
+        assert not cache.exists_in_cache("etl", "agencies", fingerprint="BBBB")
+        assert not cache.exists_in_cache("etl", "agencies", "csv", "AAAA")
+    finally:
+        saved.set()
+    cache.flush()
+    assert cache.exists_in_cache("etl", "agencies", "parquet", "AAAA")
+
+
+def test_replaced_manifest_is_read_again(df):
+    cache = open_cache()
+    save(cache, df, "20210101_000000", fingerprint="AAAA")
+    assert cache.exists_in_cache("etl", "agencies", fingerprint="AAAA")
+
+    # Replaced by another process, with the same size and modification time
+    path = os.path.join(cache.local_cache_root, "manifest.json")
+    stat = os.stat(path)
+    with open(path) as f:
+        content = f.read().replace("AAAA", "BBBB")
+    with open(path + ".tmp", "w") as f:
+        f.write(content)
+    os.utime(path + ".tmp", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(path + ".tmp", path)
+
+    assert cache.exists_in_cache("etl", "agencies", fingerprint="BBBB")
+    assert not cache.exists_in_cache("etl", "agencies", fingerprint="AAAA")
+
+
+def test_reads_are_not_blocked_by_writes_of_the_same_object(df, monkeypatch):
+    cache = open_cache()
+    save(cache, df, "20210101_000000")
+    write_file = cache.write_file
+    writing, written = threading.Event(), threading.Event()
+
+    def slow_write(*args, **kwargs):
+        writing.set()
+        written.wait(timeout=10)
+        write_file(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "write_file", slow_write)
+    writer = threading.Thread(target=save, args=(cache, df, "20210102_000000"))
+    writer.start()
+    try:
+        writing.wait(timeout=10)
+        reads = []
+        reader = threading.Thread(
+            target=lambda: reads.append(
+                cache.get_from_cache("etl", "agencies", "parquet")
+            )
+        )
+        reader.start()
+        reader.join(timeout=5)
+        # The previous version is read while the new one is written
+        assert not reader.is_alive()
+        pd.testing.assert_frame_equal(reads[0], df)
+    finally:
+        written.set()
+        writer.join()
+    assert cached_files(cache)[-1] == "agencies_20210102_000000.parquet"
+
+
+def test_background_write_keeps_the_columns_saved(df, monkeypatch):
+    cache = open_cache(async_writes=True)
+    write_file = cache.write_file
+    saved = threading.Event()
+
+    def write_once_saved(*args, **kwargs):
+        saved.wait(timeout=10)
+        write_file(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "write_file", write_once_saved)
+    save(cache, df, "20210101_000000")
+    # Columns of the saved dataframe are changed before it is written
+    expected = df.copy()
+    df.drop(columns="score", inplace=True)
+    saved.set()
+
+    # Reads wait for the pending write of the object
+    read = cache.get_from_cache("etl", "agencies", "parquet")
+    pd.testing.assert_frame_equal(read, expected)
+
+
+@pytest.mark.parametrize("extension", ["parquet", "dill"])
+def test_stats_report_read_parse_and_write_times(df, extension, tmp_path):
+    cache = open_cache()
+    save(
+        cache, df, "20210101_000000", extension=extension, predictor=df, fingerprint="a"
+    )
+    # Read from disk, as versions with a fingerprint are not kept in memory
+    read = cache.get_from_cache("etl", "agencies", extension, fingerprint="a")
+    pd.testing.assert_frame_equal(read, df)
+
+    cache.save_stats(str(tmp_path / "cache_stats.json"))
+    with open(tmp_path / "cache_stats.json") as f:
+        stats = json.load(f)["objects"]["etl/agencies"]
+    assert (stats["num_reads"], stats["num_writes"]) == (1, 1)
+    assert stats["read_s"] > 0 and stats["parse_s"] > 0 and stats["write_s"] > 0
+
+
+def test_concurrent_reads_of_an_object_share_one_read(df, monkeypatch):
+    cache = open_cache()
+    save(cache, df, "20210101_000000")
+    cache = open_cache()
+    read_content = cache._read_content
+    num_reads = []
+    reading, shared = threading.Event(), threading.Event()
+
+    def slow_read(*args, **kwargs):
+        num_reads.append(1)
+        reading.set()
+        shared.wait(timeout=10)
+        return read_content(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "_read_content", slow_read)
+    reads = []
+    readers = [
+        threading.Thread(
+            target=lambda: reads.append(
+                cache.get_from_cache("etl", "agencies", "parquet")
+            )
+        )
+        for _ in range(4)
+    ]
+    readers[0].start()
+    try:
+        reading.wait(timeout=10)
+        for reader in readers[1:]:
+            reader.start()
+        # The other readers wait for the read in progress
+        deadline = time.monotonic() + 10
+        while cache.stats()["totals"]["shared_reads"] < 3:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        shared.set()
+        for reader in readers:
+            reader.join()
+
+    assert len(num_reads) == 1
+    assert len(reads) == 4
+    for read in reads:
+        pd.testing.assert_frame_equal(read, df)
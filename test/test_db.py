@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from helper.db import bulk_replace_table, upsert_table
+
+KEY_COLUMNS = ["agency_code", "price_min_keuros"]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'fees.db'}")
+
+
+def fees_frame(rates: dict) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            {"agency_code": code, "price_min_keuros": price, "agency_rate": rate}
+            for (code, price), rate in rates.items()
+        ]
+    )
+
+
+def read_fees(engine) -> pd.DataFrame:
+    return (
+        pd.read_sql_query('select * from "agency_fees"', engine)
+        .sort_values(KEY_COLUMNS)
+        .reset_index(drop=True)
+    )
+
+
+def test_upsert_without_manifest_uploads_all_rows(engine):
+    fees = fees_frame({("a", 0): 0.05, ("a", 100): 0.04})
+    counts = upsert_table(fees, "agency_fees", engine, KEY_COLUMNS)
+
+    assert counts == {"inserted": 2, "updated": 0, "deleted": 0}
+    pd.testing.assert_frame_equal(read_fees(engine), fees)
+
+
+def test_upsert_inserts_updates_and_deletes_changed_rows(engine):
+    previous = fees_frame({("a", 0): 0.05, ("a", 100): 0.04, ("b", 0): 0.06})
+    bulk_replace_table(previous, "agency_fees", engine, key_columns=KEY_COLUMNS)
+
+    fees = fees_frame({("a", 0): 0.05, ("a", 100): 0.03, ("c", 0): 0.07})
+    counts = upsert_table(fees, "agency_fees", engine, KEY_COLUMNS, chunksize=1)
+
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1}
+    pd.testing.assert_frame_equal(read_fees(engine), fees)
+    # The manifest tracks the new rows, so that uploading them again changes nothing
+    counts = upsert_table(fees, "agency_fees", engine, KEY_COLUMNS)
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0}
+
+
+def test_upsert_with_duplicated_keys_uploads_all_rows(engine):
+    bulk_replace_table(
+        fees_frame({("a", 0): 0.05}), "agency_fees", engine, key_columns=KEY_COLUMNS
+    )
+    fees = pd.concat([fees_frame({("a", 0): 0.05})] * 2, ignore_index=True)
+
+    counts = upsert_table(fees, "agency_fees", engine, KEY_COLUMNS)
+
+    assert counts == {"inserted": 2, "updated": 0, "deleted": 0}
+    assert read_fees(engine).shape[0] == 2
@@ -0,0 +1,85 @@
+import functools
+import threading
+import time
+
+import pytest
+
+from data.etl.scheduler import run_dag
+
+
+def recorded_tasks(names: list, calls: list, duration_s: float = 0.0) -> dict:
+    """
+    Tasks appending their name to `calls` when they start, and returning it in upper case
+    """
+
+    def task(name):
+        calls.append(name)
+        time.sleep(duration_s)
+        return name.upper()
+
+    return {name: functools.partial(task, name) for name in names}
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_tasks_start_after_their_dependencies(max_workers):
+    calls = []
+    dependencies = {"c": ["a", "b"], "d": ["c"], "b": ["a"]}
+
+    report = run_dag(
+        recorded_tasks(["d", "c", "b", "a"], calls), dependencies, max_workers
+    )
+
+    assert calls == ["a", "b", "c", "d"]
+    assert {name: node["result"] for name, node in report["tasks"].items()} == {
+        "a": "A",
+        "b": "B",
+        "c": "C",
+        "d": "D",
+    }
+    assert report["critical_path"] == ["a", "b", "c", "d"]
+    for name, upstream in dependencies.items():
+        for upstream_name in upstream:
+            assert (
+                report["tasks"][upstream_name]["end_s"]
+                <= report["tasks"][name]["start_s"]
+            )
+
+
+def test_independent_tasks_run_concurrently():
+    # Each task waits for the other one to start
+    barrier = threading.Barrier(2, timeout=5)
+    tasks = {"a": barrier.wait, "b": barrier.wait}
+
+    report = run_dag(tasks, {}, max_workers=2)
+
+    assert set(report["tasks"]) == {"a", "b"}
+
+
+def test_dependencies_outside_tasks_are_ignored():
+    calls = []
+    run_dag(recorded_tasks(["a", "b"], calls), {"b": ["a", "not_updated"]})
+    assert calls == ["a", "b"]
+
+
+def test_failed_task_stops_downstream_tasks():
+    calls = []
+    tasks = recorded_tasks(["a", "c"], calls)
+
+    def fail():
+        calls.append("b")
+        raise KeyError("b failed")
+
+    tasks["b"] = fail
+
+    with pytest.raises(KeyError, match="b failed"):
+        run_dag(tasks, {"b": ["a"], "c": ["b"]}, max_workers=2)
+    assert calls == ["a", "b"]
+
+
+def test_cycle_is_detected():
+    calls = []
+    with pytest.raises(ValueError, match="Cycle"):
+        run_dag(
+            recorded_tasks(["a", "b", "c"], calls), {"a": ["c"], "b": ["a"], "c": ["b"]}
+        )
+    assert calls == []
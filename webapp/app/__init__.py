@@ -1,5 +1,12 @@
+import logging
 from flask import Flask
+from config.immo_config import ImmoConfig
+from helper.cache import Cache
 from webapp.webapp_config import Config
+from webapp.app.utils.db_engine import get_engine
+from webapp.app.utils.fee_index import FeeIndex
+from webapp.app.utils.response_cache import ResponseCache
+from webapp.app.utils.table_version import TableVersion
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
@@ -8,4 +15,57 @@ app.config.from_object(Config)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+
+def get_agency_fees_engine():
+    """
+    Pooled engine to the `agency_fees` database, shared by all the requests of the worker
+    """
+    return get_engine(
+        app.config["AGENCY_FEES_DATABASE_URI"],
+        pool_size=app.config["AGENCY_FEES_POOL_SIZE"],
+        max_overflow=app.config["AGENCY_FEES_MAX_OVERFLOW"],
+    )
+
+
+table_version = TableVersion(
+    get_agency_fees_engine, app.config["AGENCY_FEES_VERSION_CHECK_SECONDS"]
+)
+# Fee index is built once per worker, and reloaded when a new `agency_fees` is uploaded
+fee_index = FeeIndex(get_agency_fees_engine, table_version)
+if app.config["FEE_LOOKUP_MODE"] == "index":
+    try:
+        fee_index.refresh()
+    except Exception:
+        # Database may not be reachable yet (e.g. for migrations), index is then built on first use
+        logging.getLogger(__name__).warning("Could not build fee index at startup")
+
+
+def load_neighbour_index():
+    """
+    Index of neighbouring postal codes, built and cached by the `postal_code_centroids` ETL.
+    It is only read on the first request needing it
+    """
+    try:
+        index = Cache(ImmoConfig({})).get_from_cache(
+            "index", "postal_code_centroids", "dill", lazy=True
+        )
+    except Exception:
+        index = None
+    if index is None:
+        logging.getLogger(__name__).warning(
+            "No postal code index in cache, agencies of nearby postal codes will not be listed"
+        )
+    return index
+
+
+neighbour_index = load_neighbour_index()
+
+# Caches of the agencies applying to a price tier, and of the rendered `list_agencies` pages
+agency_list_cache = ResponseCache(
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"], app.config["RESPONSE_CACHE_TTL_SECONDS"]
+)
+page_cache = ResponseCache(
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"], app.config["RESPONSE_CACHE_TTL_SECONDS"]
+)
+
 from webapp.app import routes, models
\ No newline at end of file
@@ -1,10 +1,15 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, IntegerField, FloatField, SubmitField
-from wtforms.validators import DataRequired
+from wtforms.validators import DataRequired, NumberRange, Optional
 
 
 class ComputeFeeForm(FlaskForm):
     postal_code = IntegerField("Code Postal", validators=[DataRequired()])
     address = StringField("Adresse", validators=[DataRequired()])
     price = FloatField("Prix", validators=[DataRequired()])
+    radius_km = FloatField(
+        "Inclure les agences à moins de (km)",
+        default=0,
+        validators=[Optional(), NumberRange(min=0)],
+    )
     submit = SubmitField("Calcule le frais d'agence")
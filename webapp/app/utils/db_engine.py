@@ -0,0 +1,137 @@
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.engine.url import make_url
+
+# Engines are shared by all the requests of a worker. They are keyed by process id, so that a
+# worker forked from a parent which already opened connections builds its own pool
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(
+    database_uri: str,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_recycle: int = 3600,
+):
+    """
+    Returns the engine of the current worker for `database_uri`, creating it on first call
+
+    Parameters
+    ----------
+    database_uri: str
+        SQLAlchemy URI of the database
+    pool_size: int, optional, default=5
+        Number of connections kept open in the pool
+    max_overflow: int, optional, default=10
+        Number of connections that can be opened on top of `pool_size` under load
+    pool_recycle: int, optional, default=3600
+        Connections older than this number of seconds are reopened
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine
+        Shared engine
+    """
+    key = (os.getpid(), database_uri)
+    if key not in _engines:
+        with _engines_lock:
+            if key not in _engines:
+                engine_kwargs = {"pool_pre_ping": True}
+                # SQLite stand-ins do not use a queue pool
+                if not make_url(database_uri).drivername.startswith("sqlite"):
+                    engine_kwargs.update(
+                        pool_size=pool_size,
+                        max_overflow=max_overflow,
+                        pool_recycle=pool_recycle,
+                    )
+                _engines[key] = create_engine(database_uri, **engine_kwargs)
+    return _engines[key]
+
+
+def query_tiers(
+    engine, postal_code: int, price_keuros: float, table: str = "agency_fees"
+) -> pd.DataFrame:
+    """
+    Retrieves the tiers of `agency_fees` applying to a property, filtering in the database.
+    The query is served by the index on (postal_code, price_min_keuros, price_max_keuros)
+    created by the `etl_to_db` routine. It can also run against `fee_grid`, which has the same
+    columns, to get the agencies already ranked by fee.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Engine to the database holding `agency_fees`
+    postal_code: int
+        Postal code of the property
+    price_keuros: float
+        Price of the property in k€
+    table: str, optional, default="agency_fees"
+        Table to query, `agency_fees` or `fee_grid`
+
+    Returns
+    -------
+    pd.DataFrame
+        Relevant rows of `table`
+    """
+    query = text(
+        f'select * from "{table}" '
+        "where postal_code = :postal_code "
+        "and price_min_keuros <= :price_keuros "
+        "and (price_max_keuros > :price_keuros or price_max_keuros is null)"
+    )
+    return pd.read_sql_query(
+        query,
+        con=engine,
+        params={"postal_code": postal_code, "price_keuros": price_keuros},
+    )
+
+
+def query_tiers_many(
+    engine, postal_codes, prices_keuros, table: str = "agency_fees"
+) -> pd.DataFrame:
+    """
+    Same as `query_tiers` for a batch of properties, with a single query for the whole batch
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Engine to the database holding `agency_fees`
+    postal_codes: array-like
+        Postal codes of the properties
+    prices_keuros: array-like
+        Prices of the properties in k€
+    table: str, optional, default="agency_fees"
+        Table to query, `agency_fees` or `fee_grid`
+
+    Returns
+    -------
+    pd.DataFrame
+        Relevant rows of `table`, with the position of the property they apply to in
+        column `property_id`
+    """
+    properties = pd.DataFrame(
+        {"postal_code": postal_codes, "price_keuros": prices_keuros}
+    ).astype({"postal_code": "int64", "price_keuros": float})
+    properties["property_id"] = range(properties.shape[0])
+
+    query = text(
+        f'select * from "{table}" where postal_code in :postal_codes'
+    ).bindparams(bindparam("postal_codes", expanding=True))
+    tiers = pd.read_sql_query(
+        query,
+        con=engine,
+        params={"postal_codes": properties["postal_code"].unique().tolist()},
+    )
+    tiers = tiers.astype({"postal_code": "int64"}).merge(properties, on="postal_code")
+    tiers = tiers[
+        (tiers.price_min_keuros <= tiers.price_keuros)
+        & (
+            (tiers.price_max_keuros > tiers.price_keuros)
+            | tiers.price_max_keuros.isna()
+        )
+    ]
+    return tiers.drop(columns="price_keuros")
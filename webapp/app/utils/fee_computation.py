@@ -1,2 +1,35 @@
-def compute_fee(agency_fees, price_keuros):
-    [x*price_keuros if x is not None else y for x,y in zip(agency_fees["agency_rate"], agency_fees["agency_fee_min_keuros"])]
\ No newline at end of file
+import numpy as np
+
+from helper.fee_computation import compute_fee
+
+
+def rank_fees(tiers, prices_keuros):
+    """
+    Computes the final fee of the tiers applying to a batch of properties, and ranks them from
+    the cheapest to the most expensive for each property
+
+    Parameters
+    ----------
+    tiers: pd.DataFrame
+        Rows of `agency_fees` with the position of the property they apply to in `property_id`
+    prices_keuros: array-like
+        Prices of the properties in k€
+
+    Returns
+    -------
+    pd.DataFrame
+        Tiers sorted by property and fee, with the fee in € rounded to the unit in
+        `agency_fee_final`
+    """
+    prices_keuros = np.asarray(prices_keuros, dtype=float)
+    fees = compute_fee(
+        tiers["agency_rate"].values,
+        tiers["agency_fee_min_keuros"].values,
+        prices_keuros[tiers["property_id"].values],
+    )
+    ranked = tiers.assign(agency_fee_final=fees * 1000).sort_values(
+        ["property_id", "agency_fee_final"], kind="mergesort"
+    )
+    return ranked.assign(
+        agency_fee_final=np.round(ranked["agency_fee_final"].values).astype(np.int64)
+    )
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from webapp.app.utils.table_version import TableVersion
+
+
+class FeeIndex(object):
+    """
+    In-memory index of the agency fee tiers, used to avoid scanning the whole `agency_fees`
+    table on every request.
+
+    Tiers are partitioned by postal code: the tiers of a postal code are stored contiguously and
+    sorted by `price_min_keuros`, so that finding the tiers applying to a price is a binary search
+    on the postal codes followed by a binary search on the lower bounds of the tiers.
+    The index is reloaded whenever a new version of the table is published in
+    `agency_fees_version`.
+    """
+
+    def __init__(self, engine_factory, table_version: TableVersion):
+        """
+        Parameters
+        ----------
+        engine_factory: callable
+            Returns the engine to the database holding `agency_fees`
+        table_version: TableVersion
+            Tracks the version of `agency_fees`
+        """
+        self._log = logging.getLogger(__name__)
+        self._engine_factory = engine_factory
+        self._table_version = table_version
+        self._lock = threading.Lock()
+        self._version = None
+        # All the arrays are swapped at once on reload, so that a lookup never mixes two versions
+        self._state = None
+
+    # ---------------------------------- API methods ----------------------------------------------------------------- #
+
+    @property
+    def version(self):
+        return self._version
+
+    def lookup(self, postal_code: int, price_keuros: float) -> np.ndarray:
+        """
+        Finds the tiers applying to a property
+
+        Parameters
+        ----------
+        postal_code: int
+            Postal code of the property
+        price_keuros: float
+            Price of the property in k€
+
+        Returns
+        -------
+        np.ndarray
+            Positions of the relevant tiers in the index
+        """
+        return self._lookup(self._get_state(), postal_code, price_keuros)
+
+    def get_tiers(self, postal_code: int, price_keuros: float) -> pd.DataFrame:
+        """
+        Same as `lookup`, but returns the rows of `agency_fees` for the relevant tiers
+        """
+        state = self._get_state()
+        return state["tiers"].take(self._lookup(state, postal_code, price_keuros))
+
+    def get_tiers_many(self, postal_codes, prices_keuros) -> pd.DataFrame:
+        """
+        Finds the tiers applying to a batch of properties in one vectorized pass
+
+        Parameters
+        ----------
+        postal_codes: array-like
+            Postal codes of the properties
+        prices_keuros: array-like
+            Prices of the properties in k€
+
+        Returns
+        -------
+        pd.DataFrame
+            Rows of `agency_fees` for the relevant tiers, with the position of the property they
+            apply to in column `property_id`
+        """
+        state = self._get_state()
+        property_ids, tier_positions = self._lookup_many(
+            state, postal_codes, prices_keuros
+        )
+        tiers = state["tiers"].take(tier_positions)
+        tiers["property_id"] = property_ids
+        return tiers
+
+    def price_tier(self, postal_codes, price_keuros: float) -> tuple:
+        """
+        Identifies the price tier of a property: two prices get the same tier if no tier of
+        `postal_codes` starts or ends between them, i.e. if the same tiers apply to both
+
+        Parameters
+        ----------
+        postal_codes: array-like
+            Postal codes the agencies are looked up in
+        price_keuros: float
+            Price of the property in k€
+
+        Returns
+        -------
+        tuple
+            Version of the index, and number of tier bounds below the price
+        """
+        state = self._get_state()
+        postal_codes = np.atleast_1d(np.asarray(postal_codes, dtype=np.int64))
+        indexed_postal_codes = state["postal_codes"]
+        n_starts, n_ends = 0, 0
+        if len(indexed_postal_codes) == 0:
+            return self._version, n_starts, n_ends
+
+        i = np.searchsorted(indexed_postal_codes, postal_codes)
+        i = np.minimum(i, len(indexed_postal_codes) - 1)
+        i = i[indexed_postal_codes[i] == postal_codes]
+        for start, end in zip(state["starts"][i], state["ends"][i]):
+            n_starts += np.searchsorted(
+                state["price_min_keuros"][start:end], price_keuros, side="right"
+            )
+            n_ends += np.count_nonzero(
+                state["price_max_keuros"][start:end] <= price_keuros
+            )
+        return self._version, int(n_starts), int(n_ends)
+
+    def refresh(self, force: bool = False):
+        """
+        Reloads the index if a new version of `agency_fees` has been published
+
+        Parameters
+        ----------
+        force: bool, optional, default=False
+            Reload even if the version did not change
+        """
+        with self._lock:
+            version = self._table_version.get(force_check=True)
+            if force or self._state is None or version != self._version:
+                self._load(version)
+
+    # ---------------------------------- Private methods ------------------------------------------------------------- #
+
+    @staticmethod
+    def _lookup(state: dict, postal_code: int, price_keuros: float) -> np.ndarray:
+        postal_codes = state["postal_codes"]
+        i = np.searchsorted(postal_codes, postal_code)
+        if i == len(postal_codes) or postal_codes[i] != postal_code:
+            return np.empty(0, dtype=np.int64)
+
+        start, end = state["starts"][i], state["ends"][i]
+        # Tiers starting at or below the price, whose upper bound is above the price
+        stop = start + np.searchsorted(
+            state["price_min_keuros"][start:end], price_keuros, side="right"
+        )
+        candidates = np.arange(start, stop)
+        return candidates[state["price_max_keuros"][start:stop] > price_keuros]
+
+    @staticmethod
+    def _lookup_many(state: dict, postal_codes, prices_keuros):
+        postal_codes = np.asarray(postal_codes, dtype=np.int64)
+        prices_keuros = np.asarray(prices_keuros, dtype=float)
+        indexed_postal_codes = state["postal_codes"]
+        if len(indexed_postal_codes) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        i = np.searchsorted(indexed_postal_codes, postal_codes)
+        i = np.minimum(i, len(indexed_postal_codes) - 1)
+        found = indexed_postal_codes[i] == postal_codes
+        starts = np.where(found, state["starts"][i], 0)
+        counts = np.where(found, state["ends"][i] - state["starts"][i], 0)
+
+        # Expand each property into the tiers of its postal code, then keep the matching ones
+        property_ids = np.repeat(np.arange(len(postal_codes)), counts)
+        first_positions = np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = np.arange(counts.sum()) - first_positions
+        tier_positions = np.repeat(starts, counts) + offsets
+        prices = prices_keuros[property_ids]
+        matching = (state["price_min_keuros"][tier_positions] <= prices) & (
+            state["price_max_keuros"][tier_positions] > prices
+        )
+        return property_ids[matching], tier_positions[matching]
+
+    def _get_state(self):
+        version = self._table_version.get()
+        if self._state is None or version != self._version:
+            # While a new version loads, other threads keep serving the current one
+            if self._lock.acquire(blocking=self._state is None):
+                try:
+                    if self._state is None or version != self._version:
+                        self._load(version)
+                finally:
+                    self._lock.release()
+        return self._state
+
+    def _load(self, version):
+        start_time = time.monotonic()
+        tiers = pd.read_sql_query(
+            "select * from agency_fees", con=self._engine_factory()
+        )
+        tiers = tiers[~tiers.postal_code.isna()].astype({"postal_code": np.int64})
+        tiers = tiers.sort_values(
+            ["postal_code", "price_min_keuros"], kind="mergesort"
+        ).reset_index(drop=True)
+
+        postal_code_values = tiers["postal_code"].values
+        postal_codes, starts, counts = np.unique(
+            postal_code_values, return_index=True, return_counts=True
+        )
+
+        self._state = {
+            "tiers": tiers,
+            "postal_codes": postal_codes,
+            "starts": starts,
+            "ends": starts + counts,
+            "price_min_keuros": tiers["price_min_keuros"].values.astype(float),
+            # Last tier of an agency is open-ended
+            "price_max_keuros": tiers["price_max_keuros"]
+            .fillna(np.inf)
+            .values.astype(float),
+        }
+        self._version = version
+
+        self._log.info(
+            f"Loaded fee index version {version}: {tiers.shape[0]} tiers over "
+            f"{len(postal_codes)} postal codes in {time.monotonic() - start_time:.2f}s"
+        )
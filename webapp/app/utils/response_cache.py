@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache(object):
+    """
+    Bounded LRU cache with time-to-live, for results computed from a versioned table.
+    All the entries are dropped as soon as a new version of the table is seen.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600):
+        """
+        Parameters
+        ----------
+        max_entries: int, optional, default=1024
+            Maximum number of entries, least recently used ones are evicted first
+        ttl_seconds: float, optional, default=600
+            Time after which an entry expires
+        """
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "evictions", "expirations", "invalidations"], 0
+        )
+
+    def get(self, key, version):
+        """
+        Returns the value cached under `key`, or None if it is missing, expired or computed from
+        another version
+
+        Parameters
+        ----------
+        key: hashable
+            Key of the entry
+        version: object
+            Current version of the table
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, key, value, version):
+        """
+        Caches `value` under `key`
+
+        Parameters
+        ----------
+        key: hashable
+            Key of the entry
+        value: object
+            Value to cache
+        version: object
+            Version of the table the value was computed from
+        """
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self._ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        """
+        Counters of the cache, to size it
+        """
+        with self._lock:
+            requests = self._counters["hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                max_entries=self._max_entries,
+                hit_ratio=self._counters["hits"] / requests if requests else None,
+                version=self._version,
+            )
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
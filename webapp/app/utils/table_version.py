@@ -0,0 +1,66 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+class TableVersion(object):
+    """
+    Latest version of `agency_fees` published by the `etl_to_db` routine in `agency_fees_version`.
+    The database is polled at most every `check_interval_seconds`, so that the version can be
+    checked on every request.
+    """
+
+    def __init__(self, engine_factory, check_interval_seconds: float = 60):
+        """
+        Parameters
+        ----------
+        engine_factory: callable
+            Returns the engine to the database holding `agency_fees`
+        check_interval_seconds: float, optional, default=60
+            Minimum time between two reads of `agency_fees_version`
+        """
+        self._log = logging.getLogger(__name__)
+        self._engine_factory = engine_factory
+        self._check_interval_seconds = check_interval_seconds
+        self._lock = threading.Lock()
+        self._last_check = None
+        self._version = None
+
+    def get(self, force_check: bool = False):
+        """
+        Returns the latest known version of `agency_fees`. When the version cannot be read, the
+        previously known one is kept, so that what was loaded from it keeps being served
+
+        Parameters
+        ----------
+        force_check: bool, optional, default=False
+            Read the version from the database even if it was checked recently
+        """
+        is_stale = self._last_check is None or (
+            time.monotonic() - self._last_check > self._check_interval_seconds
+        )
+        # Only one thread reads the version, others keep the one already known
+        if (force_check or is_stale) and self._lock.acquire(
+            blocking=self._last_check is None or force_check
+        ):
+            try:
+                self._version = self._read_version()
+            except SQLAlchemyError:
+                self._log.warning(
+                    "Could not read 'agency_fees_version', cached fees will not be refreshed "
+                    f"until it can be read, keeping version {self._version}"
+                )
+            finally:
+                # Failed reads are not retried before the next check either
+                self._last_check = time.monotonic()
+                self._lock.release()
+        return self._version
+
+    def _read_version(self):
+        with self._engine_factory().connect() as connection:
+            return connection.execute(
+                text('select max(version) from "agency_fees_version"')
+            ).scalar()